@@ -1,5 +1,8 @@
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import queue
+import threading
 import binance.client as bclient
 
 # Responsible for generating connectors for API services by using the api keys obtained from the keys.json files inside the folder keys
@@ -20,4 +23,43 @@ class BinanceConnectionManager(ConnectionManager):
             api_key = self.credentials['api_key'],
             api_secret= self.credentials['api_secret'],
             testnet=self.testnet
-        )
\ No newline at end of file
+        )
+
+# Pool of reusable clients. Each client keeps its HTTP session (keep-alive) between requests,
+# so worker threads share a fixed set of connections instead of opening one per task
+class ClientPool:
+    def __init__(self, connection_manager: ConnectionManager, size=5):
+        self._connection_manager = connection_manager
+        self.size = size
+        self.created = 0
+        self._clients = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._clients.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if create:
+            try:
+                return self._connection_manager.generate_client()
+            except Exception:
+                with self._lock:
+                    self.created -= 1
+                raise
+        # Every client is in use, wait for one to be released
+        return self._clients.get()
+
+    @contextmanager
+    def client(self):
+        """Borrows a client for the duration of the with block"""
+        client = self._acquire()
+        try:
+            yield client
+        finally:
+            self._clients.put(client)
@@ -1,83 +1,169 @@
-from tools import credential_manager as creds
+from tools import credential_manager as creds, dataset_writer as dsw
 from connections import api_connections as api_cnx
-from extractor import api_clients as api_cli, api_extractor as api_xtr
+from extractor import api_clients as api_cli, api_extractor as api_xtr, rate_limiter as rl, chunk_planner as cpl
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import threading
 
 
 
-def extract_binance_api_data(market='futures', symbol='BTCUSDT', interval='15m', start_date='2025-02-01', end_date='2026-01-01', testnet=False):
-    # Read credentials
-    manager = creds.CredentialsManager(reader=creds.JsonCredentialReader())
-    bn_credentials = creds.BinanceCredentialsManager(credentials_manager=manager).credentials
+# Binance client pools of the process, one per environment (testnet or not)
+_client_pools = {}
+_client_pools_lock = threading.Lock()
 
-    # Generate connection to Binance
-    bn_client = api_cnx.BinanceConnectionManager(credentials=bn_credentials, testnet=testnet).generate_client()
+def get_client_pool(testnet=False, size=5):
+    """Returns the process client pool, reading the credentials only the first time"""
+    with _client_pools_lock:
+        pool = _client_pools.get(testnet)
+        if pool is None:
+            # Read credentials
+            manager = creds.CredentialsManager(reader=creds.JsonCredentialReader())
+            bn_credentials = creds.BinanceCredentialsManager(credentials_manager=manager).credentials
+
+            # Connection to Binance shared by every worker
+            connection_manager = api_cnx.BinanceConnectionManager(credentials=bn_credentials, testnet=testnet)
+            pool = _client_pools[testnet] = api_cnx.ClientPool(connection_manager, size=size)
+        pool.size = max(pool.size, size)
+        return pool
+
+
+def extract_binance_api_window(market='futures', symbol='BTCUSDT', interval='15m', start_time=None, end_time=None, testnet=False, rate_limiter=None, client_pool=None):
+    client_pool = client_pool or get_client_pool(testnet=testnet)
+
+    # Borrow a connection to Binance
+    with client_pool.client() as bn_client:
+        # Correct client assignment, all workers share the market rate limiter
+        if market == 'spot':
+            api_candle_client = api_cli.BinanceSpotClient(client=bn_client, rate_limiter=rate_limiter or rl.SPOT_RATE_LIMITER)
+        else:
+            api_candle_client = api_cli.BinanceFuturesClient(client=bn_client, rate_limiter=rate_limiter or rl.FUTURES_RATE_LIMITER)
+
+        item = api_xtr.BinanceApiExtractor(symbol=symbol, api_client=api_candle_client)
+        return item.get_window(start_time=start_time, end_time=end_time, interval=interval)
+
+
+def extract_binance_api_data(market='futures', symbol='BTCUSDT', interval='15m', start_date='2025-02-01', end_date='2026-01-01', testnet=False, rate_limiter=None, client_pool=None):
+    return extract_binance_api_window(market=market, symbol=symbol, interval=interval,
+                                      start_time=cpl.date_to_ms(start_date), end_time=cpl.date_to_ms(end_date),
+                                      testnet=testnet, rate_limiter=rate_limiter, client_pool=client_pool)
 
-    # Correct client assignment
-    if market == 'spot':
-        api_candle_client = api_cli.BinanceSpotClient(client=bn_client)
-    else:
-        api_candle_client = api_cli.BinanceFuturesClient(client=bn_client)
 
-    item = api_xtr.BinanceApiExtractor(symbol=symbol, api_client=api_candle_client)
-    return item.get_data(interval=interval, start_date=start_date, end_date=end_date)
+def client_limit(market='futures'):
+    return api_cli.BinanceSpotClient.LIMIT if market == 'spot' else api_cli.BinanceFuturesClient.LIMIT
 
 
-def get_data_range(start_date, end_date, chunk_size_days=3, max_workers=5, interval='15m',market='futures',symbol ='BTCUSDT'):
-    #Binance api limit settings
-    request_counter = 0
-    REQUEST_LIMIT = 4000
-    WAIT_TIME = 61
-    
-    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+def generate_windows(start_date, end_date, interval='15m', market='futures'):
+    """Request windows holding at most one full page of candles of the market client"""
+    limit = client_limit(market)
+    return cpl.plan_windows(cpl.date_to_ms(start_date), cpl.date_to_ms(end_date), interval, limit)
 
-    date_ranges = []
-    current_date = start_date_obj
 
-    # Generar rangos de fechas
-    while current_date < end_date_obj:
-        start = current_date
-        end = min(current_date + timedelta(days=chunk_size_days), end_date_obj)
-        date_ranges.append((start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')))
-        current_date = end
+def get_data_range(start_date, end_date, max_workers=5, interval='15m',market='futures',symbol ='BTCUSDT'):
+    # Binance api limits are enforced per request by the shared rate limiter of the clients
+    windows = generate_windows(start_date, end_date, interval, market)
 
     data_frames = []
+    client_pool = get_client_pool(testnet=False, size=max_workers)
 
     # Paralelización
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         future_to_date = {
-            executor.submit(extract_binance_api_data, start_date=start, end_date=end, testnet=False, interval=interval,market = market,symbol = symbol): (start, end)
-            for start, end in date_ranges
+            executor.submit(extract_binance_api_window, start_time=start, end_time=end, testnet=False, interval=interval,market = market,symbol = symbol, client_pool=client_pool): (start, end)
+            for start, end in windows
         }
 
         for future in as_completed(future_to_date):
             start, end = future_to_date[future]
             try:
-                print(f"Extracting data from {start} to {end}")
+                print(f"Extracting data from {cpl.ms_to_str(start)} to {cpl.ms_to_str(end)}")
                 df = future.result()
                 data_frames.append(df)
 
-                # Incrementar el contador de requests
-                request_counter += 1
-                
-                # Verificar si se ha alcanzado el límite de requests
-                if request_counter >= REQUEST_LIMIT:
-                    print(f"Se alcanzaron {REQUEST_LIMIT} requests. Esperando {WAIT_TIME} segundos...")
-                    time.sleep(WAIT_TIME)
-                    request_counter = 0  # Reiniciar el contador después de la espera
-
             except Exception as e:
-                print(f"Error extracting data from {start} to {end}: {e}")
-                time.sleep(5)  # Esperar antes de reintentar
+                print(f"Error extracting data from {cpl.ms_to_str(start)} to {cpl.ms_to_str(end)}: {e}")
 
     return pd.concat(data_frames, ignore_index=True)
 
 
+def stream_data_range(start_date, end_date, dataset_dir=None, max_workers=5, interval='15m', market='futures', symbol='BTCUSDT', output_format='parquet'):
+    """
+    Downloads the date range and appends each chunk to the local dataset (see get_dataset_writer)
+    as soon as it arrives. Only max_workers * 2 chunks are in flight
+    at any time, so memory does not grow with the length of the date range.
+    """
+    writer = get_dataset_writer(dataset_dir, symbol, interval, output_format)
+    windows = generate_windows(start_date, end_date, interval, market)
+    return stream_windows(windows, writer, max_workers=max_workers, interval=interval, market=market, symbol=symbol)
+
+
+def sync_data_range(start_date, end_date, dataset_dir=None, max_workers=5, interval='15m', market='futures', symbol='BTCUSDT', output_format='parquet'):
+    """
+    Incremental version of stream_data_range: reads the open times already stored in the
+    dataset and downloads only the missing ranges.
+    """
+    writer = get_dataset_writer(dataset_dir, symbol, interval, output_format)
+    start_time, end_time = cpl.date_to_ms(start_date), cpl.date_to_ms(end_date)
+    coverage = writer.coverage(pd.to_datetime(start_time, unit='ms'), pd.to_datetime(end_time, unit='ms'))
+    gaps = cpl.find_gaps(coverage, start_time, end_time, interval)
+
+    if not gaps:
+        print(f"Data from {start_date} to {end_date} is already up to date")
+        return writer
+
+    print(f"Found {len(gaps)} missing ranges from {start_date} to {end_date}")
+    windows = cpl.plan_gap_windows(gaps, interval, client_limit(market))
+    return stream_windows(windows, writer, max_workers=max_workers, interval=interval, market=market, symbol=symbol)
+
+
+def get_dataset_writer(dataset_dir=None, symbol='BTCUSDT', interval='15m', output_format='parquet'):
+    """output_format: 'parquet' for the partitioned Parquet dataset, 'memmap' for the memory-mapped columnar store"""
+    if output_format == 'memmap':
+        dataset_dir = dataset_dir or Path(__file__).resolve().parent.parent / 'data' / 'candles'
+        return dsw.MemmapCandleStore(root=dataset_dir, symbol=symbol, interval=interval)
+    dataset_dir = dataset_dir or Path(__file__).resolve().parent.parent / 'data' / 'klines'
+    return dsw.ParquetDatasetWriter(root=dataset_dir, symbol=symbol, interval=interval)
+
+
+def closed_candles(df):
+    """Drops the candle still in progress, so it is not stored and later counted as covered by sync_data_range"""
+    now = pd.Timestamp.now(tz='UTC').tz_localize(None)
+    return df[df['Close Time'] < now]
+
+
+def stream_windows(windows, writer, max_workers=5, interval='15m', market='futures', symbol='BTCUSDT'):
+    windows = iter(windows)
+    max_pending = max_workers * 2
+    client_pool = get_client_pool(testnet=False, size=max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        while True:
+            for start, end in windows:
+                pending[executor.submit(extract_binance_api_window, start_time=start, end_time=end, testnet=False, interval=interval, market=market, symbol=symbol, client_pool=client_pool)] = (start, end)
+                if len(pending) >= max_pending:
+                    break
+
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                # Drop the reference so the chunk can be released once written
+                start, end = pending.pop(future)
+                try:
+                    writer.write(closed_candles(future.result()))
+                    print(f"Extracted data from {cpl.ms_to_str(start)} to {cpl.ms_to_str(end)} ({writer.rows_written} rows written)")
+                except Exception as e:
+                    print(f"Error extracting data from {cpl.ms_to_str(start)} to {cpl.ms_to_str(end)}: {e}")
+
+    writer.compact()
+    print(f"Data saved in {writer.root}")
+    return writer
+
+
 
 def first_day_of_year():
     return datetime(datetime.now().year, 1, 1).strftime('%Y-%m-%d')
@@ -125,16 +211,22 @@ if __name__ == '__main__':
     interval = interval if interval else default_interval
 
 
-    default_file_name = f"{symbol}_{market}_{interval}_{start_date}_{end_date}.csv"
-    file_name = input(f"Enter the file name or press Enter to use the default({default_file_name}): ")
+    output_format = input("Enter the output format (csv, parquet or memmap) or press Enter to use the default (csv): ")
+
+    if output_format in ('parquet', 'memmap'):
+        # Download only the missing candles, streaming them into the local dataset
+        sync_data_range(start_date, end_date, interval=interval, market=market, symbol=symbol, output_format=output_format)
+    else:
+        default_file_name = f"{symbol}_{market}_{interval}_{start_date}_{end_date}.csv"
+        file_name = input(f"Enter the file name or press Enter to use the default({default_file_name}): ")
 
-    # Assign default values if inputs are empty
-    start_date = start_date if start_date else first_day_of_year()
-    end_date = end_date if end_date else second_day_of_next_month()
-    interval = interval if interval else '15m'
-    file_name = file_name if file_name else default_file_name
+        # Assign default values if inputs are empty
+        start_date = start_date if start_date else first_day_of_year()
+        end_date = end_date if end_date else second_day_of_next_month()
+        interval = interval if interval else '15m'
+        file_name = file_name if file_name else default_file_name
 
-    data = get_data_range(start_date, end_date, interval=interval,market=default_market,symbol=default_symbol)
-    save_df_to_csv(data, file_name)
+        data = get_data_range(start_date, end_date, interval=interval,market=default_market,symbol=default_symbol)
+        save_df_to_csv(data, file_name)
 
-    print(data)
+        print(data)
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 import binance.client as bclient
+from binance.exceptions import BinanceAPIException
+from .rate_limiter import RateLimiter, futures_klines_weight, spot_klines_weight
 
 #Responsible for generating the clients, tools used to provide data from the API
 
@@ -9,30 +11,58 @@ class ApiClient(ABC):
     def get_klines(self, symbol, interval, start_time, end_time):
         pass
 
-# Client implementation for Binance futures
-class BinanceFuturesClient(ApiClient):
-    def __init__(self, client:bclient.Client):
+# Common request handling for Binance clients
+class BinanceClient(ApiClient):
+    def __init__(self, client:bclient.Client, rate_limiter:RateLimiter=None):
         self.client = client
+        self.rate_limiter = rate_limiter
+
+    def request(self, weight, func, **kwargs):
+        """Runs an API call through the rate limiter, feeding it the weight reported by the server"""
+        if self.rate_limiter is None:
+            return func(**kwargs)
+
+        self.rate_limiter.acquire(weight)
+        try:
+            result = func(**kwargs)
+        except BinanceAPIException as e:
+            # 429: limit exceeded, 418: IP banned. Stop every worker for the time Binance asks
+            if e.status_code in (418, 429):
+                headers = getattr(e.response, 'headers', None) or {}
+                self.rate_limiter.penalize(float(headers.get('Retry-After', 60)))
+            raise
+
+        response = getattr(self.client, 'response', None)
+        self.rate_limiter.update(getattr(response, 'headers', None))
+        return result
+
+# Client implementation for Binance futures
+class BinanceFuturesClient(BinanceClient):
+    LIMIT = 1500
 
     def get_klines(self, symbol, interval, start_time, end_time):
-        return self.client.futures_klines(
+        return self.request(
+            futures_klines_weight(self.LIMIT),
+            self.client.futures_klines,
             symbol=symbol,
             interval=interval,
             startTime=start_time,
             endTime=end_time,
-            limit=1500
+            limit=self.LIMIT
         )
 
 # Client implementation for  Binance Spot
-class BinanceSpotClient(ApiClient):
-    def __init__(self, client:bclient.Client):
-        self.client = client
+class BinanceSpotClient(BinanceClient):
+    LIMIT = 1000
 
     def get_klines(self, symbol, interval, start_time, end_time):
-        return self.client.get_historical_klines(
+        # get_historical_klines paginates internally, only the first page weight is reserved up front
+        return self.request(
+            spot_klines_weight(self.LIMIT),
+            self.client.get_historical_klines,
             symbol=symbol,
             interval=interval,
             start_str=start_time,
             end_str=end_time,
-            limit=1000
+            limit=self.LIMIT
         )
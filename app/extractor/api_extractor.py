@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 from .api_clients import *
 from .api_formatter import *
+from .chunk_planner import date_to_ms
 
 # Responsible for delivering information from the API with an appropriate format using a dataframe
 
@@ -19,14 +20,15 @@ class BinanceApiExtractor(ApiExtractor):
         self.symbol = symbol
 
     def get_data(self, start_date, end_date, interval):
-        start_ts = int(datetime.strptime(start_date, "%Y-%m-%d").timestamp() * 1000)
-        end_ts = int(datetime.strptime(end_date, "%Y-%m-%d").timestamp() * 1000)
+        return self.get_window(date_to_ms(start_date), date_to_ms(end_date), interval)
 
+    def get_window(self, start_time, end_time, interval):
+        """Candles between two ms timestamps (inclusive), see chunk_planner.plan_windows"""
         klines = self.api_client.get_klines(
             symbol=self.symbol,
             interval=interval,
-            start_time=start_ts,
-            end_time=end_ts
+            start_time=start_time,
+            end_time=end_time
         )
 
         return self.formatter.format(klines)
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+import numpy as np
+
+# Responsible for splitting a time range into request windows sized by candle count,
+# so every request to the API returns a full page and no candle is dropped by the limit
+
+INTERVAL_MS = {
+    's': 1000,
+    'm': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000,
+    # Months have variable length, the longest one is used so a window never exceeds the limit
+    'M': 31 * 24 * 60 * 60 * 1000,
+}
+
+def interval_to_ms(interval: str) -> int:
+    """Converts a Binance interval string (e.g. '1m', '15m', '4h', '1d') into milliseconds"""
+    try:
+        return int(interval[:-1]) * INTERVAL_MS[interval[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid interval: {interval}")
+
+# Dates are UTC, as the open times returned by the API, whatever the timezone of the host
+
+def date_to_ms(date: str) -> int:
+    return int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def ms_to_str(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+def plan_windows(start_time: int, end_time: int, interval: str, limit: int):
+    """
+    Returns (startTime, endTime) windows in ms covering [start_time, end_time) with at most
+    limit candles each. Both window bounds are inclusive, as in the Binance API.
+    """
+    window_ms = interval_to_ms(interval) * limit
+    windows = []
+    current = start_time
+    while current < end_time:
+        window_end = min(current + window_ms, end_time)
+        windows.append((current, window_end - 1))
+        current = window_end
+    return windows
+
+def find_gaps(open_times, start_time: int, end_time: int, interval: str):
+    """
+    Missing ranges of [start_time, end_time) given the ms open times already stored.
+    Returns half-open (start, end) ranges, ready to be split with plan_windows.
+    """
+    step = interval_to_ms(interval)
+    open_times = np.unique(np.asarray(open_times, dtype=np.int64))
+    open_times = open_times[(open_times >= start_time) & (open_times < end_time)]
+    if not open_times.size:
+        return [(start_time, end_time)] if start_time < end_time else []
+
+    # A gap exists wherever the next stored candle is not the one right after the previous
+    starts = np.concatenate(([start_time], open_times + step))
+    ends = np.concatenate((open_times, [end_time]))
+    missing = ends > starts
+    return [(int(start), int(end)) for start, end in zip(starts[missing], ends[missing])]
+
+def plan_gap_windows(gaps, interval: str, limit: int):
+    return [window for start, end in gaps for window in plan_windows(start, end, interval, limit)]
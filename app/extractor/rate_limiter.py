@@ -0,0 +1,127 @@
+from abc import ABC, abstractmethod
+import threading
+import time
+
+# Responsible for keeping the requests of every extraction worker under the API weight limits
+
+# Request weights of the Binance endpoints used by the clients
+def futures_klines_weight(limit: int) -> int:
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+def spot_klines_weight(limit: int) -> int:
+    return 2
+
+USED_WEIGHT_HEADER = 'X-MBX-USED-WEIGHT-1M'
+RETRY_AFTER_HEADER = 'Retry-After'
+
+
+# Abstraction for rate limiters
+class RateLimiter(ABC):
+    @abstractmethod
+    def acquire(self, weight: int = 1):
+        pass
+
+    @abstractmethod
+    def update(self, headers):
+        pass
+
+    @abstractmethod
+    def penalize(self, seconds: float):
+        pass
+
+
+# Token bucket shared by all the threads of a process.
+# Binance counts weight per clock-aligned minute, so on top of the bucket (which spreads requests
+# over the window) the weight used in the current window is tracked and synced with the server.
+class TokenBucketRateLimiter(RateLimiter):
+    def __init__(self, capacity: int, period: float = 60, clock=time.time, sleep=time.sleep):
+        """
+        :param capacity: Weight allowed per period (e.g. 2400 per minute for futures).
+        :param period: Window in seconds the capacity refers to. Tokens refill continuously.
+        :param clock: Wall clock time source (windows are aligned to it), injectable for tests.
+        :param sleep: Sleep function, injectable for tests.
+        """
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._window = self._updated // period
+        self._window_used = 0
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    @property
+    def window_used(self) -> int:
+        with self._lock:
+            self._refill()
+            return self._window_used
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now // self.period != self._window:
+            self._window = now // self.period
+            self._window_used = 0
+
+    def acquire(self, weight: int = 1):
+        """Blocks until weight tokens are available in the bucket and in the current window, and consumes them"""
+        if weight > self.capacity:
+            raise ValueError(f"Request weight {weight} exceeds the limiter capacity {self.capacity}")
+
+        while True:
+            with self._lock:
+                self._refill()
+                wait_time = self._blocked_until - self._updated
+                if wait_time <= 0:
+                    bucket_ok = self._tokens >= weight
+                    window_ok = self._window_used + weight <= self.capacity
+                    if bucket_ok and window_ok:
+                        self._tokens -= weight
+                        self._window_used += weight
+                        return
+                    wait_time = max(
+                        0 if bucket_ok else (weight - self._tokens) / self.rate,
+                        0 if window_ok else (self._window + 1) * self.period - self._updated
+                    )
+            self._sleep(wait_time)
+
+    def update(self, headers):
+        """Syncs the current window with the weight the server reports as already used"""
+        if not headers:
+            return
+        used = headers.get(USED_WEIGHT_HEADER)
+        if used is not None:
+            with self._lock:
+                self._refill()
+                self._window_used = max(self._window_used, int(used))
+        retry_after = headers.get(RETRY_AFTER_HEADER)
+        if retry_after is not None:
+            self.penalize(float(retry_after))
+
+    def penalize(self, seconds: float):
+        """Blocks every worker for the given seconds (429/418 responses)"""
+        with self._lock:
+            self._refill()
+            self._blocked_until = max(self._blocked_until, self._updated + seconds)
+            self._tokens = 0
+
+
+# Default limiters shared by every worker of the process
+FUTURES_RATE_LIMITER = TokenBucketRateLimiter(capacity=2400)
+SPOT_RATE_LIMITER = TokenBucketRateLimiter(capacity=6000)
@@ -0,0 +1,41 @@
+from tools import credential_manager as creds, connection_manager as pg_cnx
+from connections import api_connections as api_cnx
+from extractor import api_clients as api_cli, rate_limiter as rl
+from stream import binance_stream_reader as bsr, kline_writer as kwr
+
+# Live ingestion: closed candles from the futures WebSocket are upserted into the live table in
+# micro-batches, seconds after they close. Candles missed while disconnected are backfilled
+# through the REST API by the reader.
+
+if __name__ == "__main__":
+
+    # Read credentials
+    manager = creds.CredentialsManager(reader=creds.JsonCredentialReader())
+    pg_credentials = creds.PgCredentialsManager(credentials_manager=manager)
+    bn_credentials = creds.BinanceCredentialsManager(credentials_manager=manager).credentials
+
+    # Table name
+    live_table_name = 'btcusdtfutures_live'
+    # Currency params
+    symbol = 'btcusdt'
+    interval = '5m'
+
+    # A single writer thread flushes at a time, one pooled connection is enough
+    pool = pg_cnx.PgConnecionManager(pg_credentials, minconn=1, maxconn=1)
+    writer = kwr.KlineBatchWriter(pool, live_table_name, batch_size=500, flush_interval=2, partitioned=True)
+
+    # REST client used to backfill gaps, on mainnet like the WebSocket stream (fstream.binance.com)
+    client = api_cnx.BinanceConnectionManager(credentials=bn_credentials, testnet=False).generate_client()
+    api_client = api_cli.BinanceFuturesClient(client, rl.FUTURES_RATE_LIMITER)
+
+    ws = bsr.BinanceFuturesWebSocket(symbol=symbol, interval=interval, on_kline_update=writer.on_kline,
+                                     api_client=api_client, closed_only=True, kline_record=True)
+    writer.start()
+    try:
+        ws.start()
+    except KeyboardInterrupt:
+        print("Stopped by user")
+    finally:
+        writer.stop()
+        pool.disconnect()
+        print(f"{writer.rows_written} candles written")
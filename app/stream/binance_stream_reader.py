@@ -1,31 +1,169 @@
 from abc import ABC, abstractmethod
+from extractor.chunk_planner import interval_to_ms
 import websocket
 import json
+import random
+import time
+
+# orjson parses kline messages several times faster than json when it is installed
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Interim (not closed) kline updates, recognizable in the raw message without parsing it
+INTERIM_MARKER = '"x":false'
+INTERIM_MARKER_BYTES = INTERIM_MARKER.encode()
+
+def is_interim(message) -> bool:
+    return (INTERIM_MARKER if isinstance(message, str) else INTERIM_MARKER_BYTES) in message
+
+def backoff_delay(attempt: int, base_delay: float = 1, max_delay: float = 60) -> float:
+    """Exponential backoff with full jitter, so many readers do not reconnect in lockstep"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def fetch_closed_klines(api_client, symbol: str, interval: str, start_time: int, end_time: int):
+    """Closed klines with open time in [start_time, end_time] from the REST API, paging through the client limit"""
+    step = interval_to_ms(interval)
+    while start_time <= end_time:
+        klines = api_client.get_klines(symbol.upper(), interval, start_time, end_time)
+        if not klines:
+            return
+        now = time.time() * 1000
+        for kline in klines:
+            # The candle in progress is delivered by the stream
+            if kline[6] >= now:
+                return
+            yield kline
+        start_time = klines[-1][0] + step
+
+
+def stream_details(kline) -> tuple:
+    """Volume details of a stream kline: quote asset volume, number of trades, taker buy base and quote volumes"""
+    return float(kline['q']), kline['n'], float(kline['V']), float(kline['Q'])
+
+def rest_details(kline) -> tuple:
+    """Same as stream_details for a REST API kline row"""
+    return float(kline[7]), kline[8], float(kline[9]), float(kline[10])
+
+
+class KlineRecord:
+    """Kline update passed to record callbacks. The same instance is refilled on every update, copy what must be kept"""
+    __slots__ = ('symbol', 'interval', 'is_closed', 'open_time', 'close_time', 'open', 'high', 'low', 'close', 'volume',
+                 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_volume', 'taker_buy_quote_volume')
+
+    def __init__(self, symbol: str, interval: str):
+        self.symbol = symbol
+        self.interval = interval
+        self.is_closed = False
+        self.open_time = 0
+        self.close_time = 0
+        self.open = 0.0
+        self.high = 0.0
+        self.low = 0.0
+        self.close = 0.0
+        self.volume = 0.0
+        self.quote_asset_volume = 0.0
+        self.number_of_trades = 0
+        self.taker_buy_base_volume = 0.0
+        self.taker_buy_quote_volume = 0.0
+
+    def update(self, is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume, details=None):
+        self.is_closed = is_closed
+        self.open_time = open_time
+        self.close_time = close_time
+        self.open = open_price
+        self.high = high_price
+        self.low = low_price
+        self.close = close_price
+        self.volume = volume
+        if details is not None:
+            self.quote_asset_volume, self.number_of_trades, self.taker_buy_base_volume, self.taker_buy_quote_volume = details
+        return self
+
+
+class KlineSequence:
+    """Tracks the last closed candle of a stream to drop duplicates and find the missing ones"""
+    def __init__(self, interval: str):
+        self.step = interval_to_ms(interval)
+        self.last_open_time = None
+
+    def missing(self, open_time: int):
+        """(start, end) open time range missing before open_time, or None"""
+        if self.last_open_time is None or open_time <= self.last_open_time + self.step:
+            return None
+        return self.last_open_time + self.step, open_time - 1
+
+    def accept(self, is_closed: bool, open_time: int) -> bool:
+        """Whether an update has to be delivered, recording it when it closes a candle"""
+        if self.last_open_time is not None and open_time <= self.last_open_time:
+            return False
+        if is_closed:
+            self.last_open_time = open_time
+        return True
+
 
 class BinanceWebSocket(ABC):
     """Parent class for Binance WebSocket clients"""
-    def __init__(self, symbol: str, interval: str, on_kline_update):
+    def __init__(self, symbol: str, interval: str, on_kline_update, api_client=None, max_backoff: float = 60,
+                 closed_only: bool = False, kline_record: bool = False):
         """
         Base constructor for any Binance WebSocket.
 
         :param symbol: Trading pair (e.g. 'btcusdt').
         :param interval: Kline interval (e.g. '15m', '1h', '5m').
         :param on_kline_update: Callback function to handle kline updates.
+        :param api_client: extractor.api_clients client used to backfill the closed candles missed while
+            disconnected (e.g. BinanceFuturesClient). Without it gaps are only reported.
+        :param max_backoff: Maximum seconds between reconnection attempts.
+        :param closed_only: Drop interim updates before parsing them, only closed candles are delivered.
+        :param kline_record: Call on_kline_update with a KlineRecord instead of eight positional arguments.
         """
         self.symbol = symbol.lower()
         self.interval = interval
         self.on_kline_update = on_kline_update
+        self.api_client = api_client
+        self.max_backoff = max_backoff
         self.socket = self.get_socket_url()
+        self.sequence = KlineSequence(interval)
+        self.closed_only = closed_only
+        self.record = KlineRecord(self.symbol, interval) if kline_record else None
+        self.ws = None
+        self._attempt = 0
+        self._stopped = False
 
     @abstractmethod
     def get_socket_url(self) -> str:
         """Must be implemented in child classes to define the WebSocket URL"""
         pass
 
+    def deliver(self, is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume, details=None):
+        """Calls the update function, skipping candles already delivered. details only feed kline records"""
+        if not self.sequence.accept(is_closed, open_time):
+            return
+        if self.record is not None:
+            self.on_kline_update(self.record.update(is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume, details))
+        else:
+            self.on_kline_update(is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume)
+
+    def backfill(self, start_time: int, end_time: int):
+        """Delivers the closed candles with open time in [start_time, end_time] through the REST API"""
+        if self.api_client is None:
+            print(f"Missing candles from {start_time} to {end_time}, no api client to backfill them")
+            return
+        try:
+            for kline in fetch_closed_klines(self.api_client, self.symbol, self.interval, start_time, end_time):
+                details = rest_details(kline) if self.record is not None else None
+                self.deliver(True, kline[0], kline[6], float(kline[1]), float(kline[2]), float(kline[3]), float(kline[4]), float(kline[5]), details)
+        except Exception as e:
+            print(f"Error backfilling candles from {start_time} to {end_time}: {e}")
+
     def on_message(self, ws, message):
         """Processes messages received from the WebSocket"""
-        data = json.loads(message)
-        kline = data['k']
+        if self.closed_only and is_interim(message):
+            return
+        kline = loads(message)['k']
 
         # Extract kline data
         is_closed = kline['x']  # If the kline has closed
@@ -37,8 +175,14 @@ class BinanceWebSocket(ABC):
         open_time = kline['t']
         close_time = kline['T']
 
+        # Candles closed between the last one delivered and this one were missed
+        gap = self.sequence.missing(open_time)
+        if gap:
+            self.backfill(*gap)
+
         # Call the update function
-        self.on_kline_update(is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume)
+        details = stream_details(kline) if self.record is not None else None
+        self.deliver(is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume, details)
 
     def on_error(self, ws, error):
         """Error handling"""
@@ -51,15 +195,34 @@ class BinanceWebSocket(ABC):
     def on_open(self, ws):
         """Displays message when connection is opened"""
         print(f"Connected to Binance WebSocket for {self.symbol.upper()} on {self.interval}")
+        self._attempt = 0
+        # After a reconnection, catch up with the candles closed while disconnected before any live update
+        if self.sequence.last_open_time is not None:
+            self.backfill(self.sequence.last_open_time + self.sequence.step, int(time.time() * 1000))
 
     def start(self):
-        """Starts the WebSocket connection and keeps the stream running"""
-        ws = websocket.WebSocketApp(self.socket, 
-                                    on_message=self.on_message, 
-                                    on_error=self.on_error, 
-                                    on_close=self.on_close)
-        ws.on_open = self.on_open
-        ws.run_forever()
+        """Starts the WebSocket connection and keeps the stream running, reconnecting when it drops"""
+        while not self._stopped:
+            self.ws = websocket.WebSocketApp(self.socket, 
+                                        on_message=self.on_message, 
+                                        on_error=self.on_error, 
+                                        on_close=self.on_close)
+            self.ws.on_open = self.on_open
+            # Pings detect half-open connections that would otherwise stay silent
+            self.ws.run_forever(ping_interval=60, ping_timeout=20)
+            if self._stopped:
+                break
+
+            delay = backoff_delay(self._attempt, max_delay=self.max_backoff)
+            self._attempt += 1
+            print(f"Reconnecting in {delay:.1f} seconds")
+            time.sleep(delay)
+
+    def stop(self):
+        """Closes the connection without reconnecting"""
+        self._stopped = True
+        if self.ws:
+            self.ws.close()
 
 class BinanceSpotWebSocket(BinanceWebSocket):
     """WebSocket for Binance spot market"""
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Fixed-capacity history of closed candles for live strategies. Candles are written in place in
+# NumPy arrays (the oldest one is overwritten when full) and every registered indicator is updated
+# with the new candle only, so the cost per candle does not depend on the length of the history.
+
+class CandleRingBuffer:
+    FIELDS = ('open_time', 'close_time', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, capacity: int = 1000, indicators: dict = None):
+        """
+        :param capacity: Candles kept.
+        :param indicators: Name to incremental indicator with an on_candle(high, low, close) method returning
+            its newest value (trainer.strategy_maker.live_indicators), e.g. EMADX_strategy.live_indicators().
+        """
+        self.capacity = capacity
+        self.count = 0
+        self.indicators = dict(indicators or {})
+        self._arrays = {field: np.zeros(capacity, dtype=np.int64 if field.endswith('_time') else np.float64) for field in self.FIELDS}
+        self._arrays.update({name: np.full(capacity, np.nan) for name in self.indicators})
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, open_time, close_time, open_price, high_price, low_price, close_price, volume):
+        """Adds a closed candle. Candles not newer than the last one are ignored"""
+        if self.count and open_time <= self.latest('open_time'):
+            return
+        i = self.count % self.capacity
+        self._arrays['open_time'][i] = open_time
+        self._arrays['close_time'][i] = close_time
+        self._arrays['open'][i] = open_price
+        self._arrays['high'][i] = high_price
+        self._arrays['low'][i] = low_price
+        self._arrays['close'][i] = close_price
+        self._arrays['volume'][i] = volume
+        for name, indicator in self.indicators.items():
+            self._arrays[name][i] = indicator.on_candle(high_price, low_price, close_price)
+        self.count += 1
+
+    def on_kline_update(self, is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume):
+        """Callback for BinanceWebSocket readers"""
+        if is_closed:
+            self.append(open_time, close_time, open_price, high_price, low_price, close_price, volume)
+
+    def on_kline(self, record):
+        """Callback for readers created with kline_record=True"""
+        if record.is_closed:
+            self.append(record.open_time, record.close_time, record.open, record.high, record.low, record.close, record.volume)
+
+    def latest(self, name: str):
+        """Newest value of a field or indicator"""
+        if not self.count:
+            raise IndexError("The buffer is empty")
+        return self._arrays[name][(self.count - 1) % self.capacity]
+
+    def latest_values(self) -> dict:
+        return {name: self.latest(name) for name in self._arrays}
+
+    def window(self, name: str, n: int = None) -> np.ndarray:
+        """Last n values (all by default) of a field or indicator, oldest first"""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity if self.count >= self.capacity else self.count
+        start = end - n
+        array = self._arrays[name]
+        if start >= 0:
+            return array[start:end]
+        # The window wraps around the end of the array
+        return np.concatenate((array[start:], array[:end]))
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+from psycopg2 import extras
+from tools.connection_manager import PgConnecionManager
+from tools.schema_manager import SchemaQueriesManager
+
+# Live ingestion of closed klines into a fact table. Candles are buffered in memory and flushed in
+# micro-batches, when batch_size candles are waiting or every flush_interval seconds, with a single
+# multi-row upsert, so database writes grow with the new candles instead of with a polling window.
+
+class KlineBatchWriter:
+    COLUMNS = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume',
+               'number_of_trades', 'taker_buy_base_volume', 'taker_buy_quote_volume', 'ignore')
+
+    def __init__(self, connection: PgConnecionManager, table_name: str, batch_size: int = 500, flush_interval: float = 2,
+                 partitioned: bool = False):
+        """
+        :param connection: Connection pool each flush borrows a connection from.
+        :param table_name: Fact table the candles are upserted into (e.g. 'btcusdtfutures_live').
+        :param batch_size: Buffered candles that trigger a flush.
+        :param flush_interval: Seconds between flushes of the background thread started by start().
+        :param partitioned: The table is managed by SchemaQueriesManager, the table and the monthly
+            partitions of each batch are created in the flush that first writes into them.
+        """
+        self._connection = connection
+        self.table_name = table_name
+        self._schemaManager = SchemaQueriesManager(connection, table_name) if partitioned else None
+        # Months whose partition is known to exist
+        self._partitions = set()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.generate_query()
+
+    def generate_query(self):
+        columns_string = ', '.join(self.COLUMNS)
+        value_columns = self.COLUMNS[1:]
+        update_set = ', '.join(f"{col}=EXCLUDED.{col}" for col in value_columns)
+        changed = f"({', '.join(f'lve.{col}' for col in value_columns)}) IS DISTINCT FROM ({', '.join(f'EXCLUDED.{col}' for col in value_columns)})"
+
+        # Candles already stored with the same values are not rewritten
+        self.query = f"""
+        INSERT INTO public.{self.table_name} AS lve ({columns_string})
+        VALUES %s
+        ON CONFLICT (open_time) DO UPDATE SET {update_set}
+        WHERE {changed};
+        """
+        # Open and close times arrive as ms timestamps and are stored in UTC
+        self.template = "(to_timestamp(%s / 1000.0) AT TIME ZONE 'UTC', %s, %s, %s, %s, %s, to_timestamp(%s / 1000.0) AT TIME ZONE 'UTC', %s, %s, %s, %s, %s)"
+
+    def add(self, record) -> bool:
+        """Buffers a closed kline record, returns whether the buffer reached batch_size"""
+        if not record.is_closed:
+            return False
+        row = (
+            record.open_time, record.open, record.high, record.low, record.close, record.volume, record.close_time,
+            record.quote_asset_volume, record.number_of_trades, record.taker_buy_base_volume, record.taker_buy_quote_volume, 0
+        )
+        with self._lock:
+            self._buffer.append(row)
+            return len(self._buffer) >= self.batch_size
+
+    def on_kline(self, record):
+        """Callback for readers created with kline_record=True"""
+        if self.add(record):
+            self.flush()
+
+    async def on_kline_async(self, record):
+        """Handler for stream multiplexers created with kline_record=True, flushing in a thread"""
+        if self.add(record):
+            await asyncio.to_thread(self.flush)
+
+    def _partition_queries(self, rows) -> tuple:
+        """Schema queries a batch needs before the upsert and the months they create"""
+        if self._schemaManager is None:
+            return [], set()
+        months = {datetime.fromtimestamp(row[0] / 1000, tz=timezone.utc).replace(tzinfo=None, day=1, hour=0, minute=0, second=0, microsecond=0)
+                  for row in rows} - self._partitions
+        if not months:
+            return [], months
+        queries = [] if self._partitions else [self._schemaManager.create_query, self._schemaManager.index_query]
+        return queries + [self._schemaManager.partition_query(month) for month in sorted(months)], months
+
+    def _write(self, conn, rows):
+        # Without its partition an insert crossing into a new month would fail on every flush
+        queries, months = self._partition_queries(rows)
+        with conn.cursor() as cursor:
+            for query in queries:
+                cursor.execute(query)
+            extras.execute_values(cursor, self.query, rows, template=self.template, page_size=len(rows))
+        conn.commit()
+        self._partitions |= months
+
+    def flush(self) -> int:
+        """Upserts the buffered candles, returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+
+            # ON CONFLICT cannot touch a row twice in one statement, the last update of a candle wins
+            rows = list({row[0]: row for row in rows}.values())
+            try:
+                # A connection lost since the last flush (e.g. database restart) is replaced by the pool
+                self._connection.execute(lambda conn: self._write(conn, rows))
+            except Exception as e:
+                # Kept for the next flush, nothing is lost while the database is unavailable
+                with self._lock:
+                    self._buffer = rows + self._buffer
+                print(f"An error occurred writing {len(rows)} candles: {e}")
+                return 0
+
+            self.rows_written += len(rows)
+            return len(rows)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Starts the background thread flushing every flush_interval seconds"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread and writes what is left in the buffer"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -0,0 +1,265 @@
+from abc import ABC, abstractmethod
+import asyncio
+import itertools
+import json
+import time
+import websockets
+from .binance_stream_reader import KlineRecord, KlineSequence, backoff_delay, fetch_closed_klines, is_interim, loads, rest_details, stream_details
+
+# Combined kline streams of many symbols/intervals over a few WebSocket connections in one event loop.
+# Each connection carries up to MAX_STREAMS streams; streams are added and removed on the fly with
+# SUBSCRIBE/UNSUBSCRIBE messages and every kline is dispatched to the async handler of its stream.
+# Dropped connections are reopened with jittered backoff and the candles closed meanwhile are
+# backfilled through the REST API before live delivery resumes.
+
+class StreamConnection:
+    """A single combined stream connection"""
+    def __init__(self, multiplexer, streams):
+        self._multiplexer = multiplexer
+        self.streams = set(streams)
+        self.ws = None
+        self._ids = itertools.count(1)
+        self._closing = False
+
+    @property
+    def url(self) -> str:
+        return f"{self._multiplexer.base_url}?streams={'/'.join(sorted(self.streams))}"
+
+    async def run(self):
+        """Connects and dispatches messages until closed, reconnecting when the connection drops"""
+        attempt = 0
+        while not self._closing:
+            initial = set(self.streams)
+            try:
+                async with websockets.connect(self.url, max_size=None) as ws:
+                    self.ws = ws
+                    attempt = 0
+                    print(f"Connected to Binance combined stream ({len(self.streams)} streams)")
+                    # Streams added while the connection was being opened
+                    if self.streams - initial:
+                        await self.send('SUBSCRIBE', sorted(self.streams - initial))
+                    # Live messages wait in the socket buffer until the missed candles are delivered
+                    await self._multiplexer.catch_up(sorted(self.streams))
+
+                    async for message in ws:
+                        await self._multiplexer.dispatch(message)
+            except (OSError, websockets.WebSocketException) as e:
+                print(f"Error: {e}")
+            except Exception as e:
+                # Anything else is handled as a dropped connection, so its streams are reopened and backfilled
+                print(f"Unexpected error: {e!r}")
+            finally:
+                self.ws = None
+            print("Connection closed")
+
+            if self._closing:
+                break
+            delay = backoff_delay(attempt, max_delay=self._multiplexer.max_backoff)
+            attempt += 1
+            print(f"Reconnecting in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+
+    async def send(self, method: str, streams):
+        await self.ws.send(json.dumps({'method': method, 'params': list(streams), 'id': next(self._ids)}))
+
+    async def subscribe(self, streams):
+        self.streams.update(streams)
+        if self.ws is not None:
+            await self.send('SUBSCRIBE', streams)
+
+    async def unsubscribe(self, streams):
+        self.streams.difference_update(streams)
+        if self.ws is not None:
+            await self.send('UNSUBSCRIBE', streams)
+
+    async def close(self):
+        self._closing = True
+        if self.ws is not None:
+            await self.ws.close()
+
+
+class BinanceStreamMultiplexer(ABC):
+    """Parent class for Binance combined stream managers"""
+    MAX_STREAMS = 200
+
+    def __init__(self, max_streams: int = None, base_url: str = None, api_client=None, max_backoff: float = 60,
+                 closed_only: bool = False, kline_record: bool = False):
+        """
+        :param max_streams: Streams per connection, defaults to the Binance limit of the market.
+        :param base_url: Combined stream endpoint, e.g. a local server replaying recorded messages.
+        :param api_client: extractor.api_clients client used to backfill the closed candles missed while
+            disconnected. Without it gaps are only reported.
+        :param max_backoff: Maximum seconds between reconnection attempts.
+        :param closed_only: Drop interim updates before parsing them, only closed candles are delivered.
+        :param kline_record: Call handlers with the KlineRecord of their stream instead of eight positional arguments.
+        """
+        self.max_streams = max_streams or self.MAX_STREAMS
+        self.base_url = base_url or self.get_base_url()
+        self.api_client = api_client
+        self.max_backoff = max_backoff
+        self.closed_only = closed_only
+        self.kline_record = kline_record
+        self.handlers = {}
+        self.subscriptions = {}
+        self.sequences = {}
+        self.records = {}
+        self.connections = {}
+
+    @abstractmethod
+    def get_base_url(self) -> str:
+        """Must be implemented in child classes to define the combined stream URL"""
+        pass
+
+    @staticmethod
+    def stream_name(symbol: str, interval: str) -> str:
+        return f"{symbol.lower()}@kline_{interval}"
+
+    def _start(self, streams):
+        connection = StreamConnection(self, streams)
+        self.connections[connection] = asyncio.create_task(connection.run())
+        return connection
+
+    async def subscribe(self, subscriptions):
+        """
+        Subscribes to several klines streams, filling the open connections before opening new ones.
+
+        :param subscriptions: Iterable of (symbol, interval, handler). Handlers are coroutine functions
+            called as handler(is_closed, open_time, close_time, open, high, low, close, volume).
+            They run on the connection reader, so slow work should be handed to another task.
+        """
+        new = []
+        for symbol, interval, handler in subscriptions:
+            stream = self.stream_name(symbol, interval)
+            if stream not in self.handlers:
+                new.append(stream)
+                self.subscriptions[stream] = (symbol, interval)
+                self.sequences[stream] = KlineSequence(interval)
+                self.records[stream] = KlineRecord(symbol, interval)
+            self.handlers[stream] = handler
+
+        for connection in list(self.connections):
+            room = self.max_streams - len(connection.streams)
+            if new and room > 0:
+                await connection.subscribe(new[:room])
+                new = new[room:]
+
+        while new:
+            self._start(new[:self.max_streams])
+            new = new[self.max_streams:]
+
+    async def unsubscribe(self, subscriptions):
+        """:param subscriptions: Iterable of (symbol, interval)"""
+        streams = {self.stream_name(symbol, interval) for symbol, interval in subscriptions}
+        for stream in streams:
+            self.handlers.pop(stream, None)
+            self.subscriptions.pop(stream, None)
+            self.sequences.pop(stream, None)
+            self.records.pop(stream, None)
+
+        for connection in list(self.connections):
+            removed = connection.streams & streams
+            if not removed:
+                continue
+            if removed == connection.streams:
+                # Nothing left on the connection
+                await connection.close()
+                self.connections.pop(connection).cancel()
+            else:
+                await connection.unsubscribe(sorted(removed))
+
+    async def deliver(self, stream, is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume, details=None):
+        """Calls the handler of the stream, skipping candles already delivered. details only feed kline records"""
+        handler = self.handlers.get(stream)
+        if handler is None or not self.sequences[stream].accept(is_closed, open_time):
+            return
+        try:
+            if self.kline_record:
+                await handler(self.records[stream].update(is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume, details))
+            else:
+                await handler(is_closed, open_time, close_time, open_price, high_price, low_price, close_price, volume)
+        except Exception as e:
+            # A failing handler must not stop the other streams of the connection
+            print(f"Error in the {stream} handler: {e!r}")
+
+    async def backfill(self, stream, start_time: int, end_time: int):
+        """Delivers the closed candles of a stream with open time in [start_time, end_time] through the REST API"""
+        if self.api_client is None:
+            print(f"Missing {stream} candles from {start_time} to {end_time}, no api client to backfill them")
+            return
+        symbol, interval = self.subscriptions[stream]
+        try:
+            # The client is blocking, it runs in a thread so the other streams keep flowing
+            klines = await asyncio.to_thread(lambda: list(fetch_closed_klines(self.api_client, symbol, interval, start_time, end_time)))
+        except Exception as e:
+            print(f"Error backfilling {stream} candles from {start_time} to {end_time}: {e}")
+            return
+        for kline in klines:
+            details = rest_details(kline) if self.kline_record else None
+            await self.deliver(stream, True, kline[0], kline[6], float(kline[1]), float(kline[2]), float(kline[3]), float(kline[4]), float(kline[5]), details)
+
+    async def catch_up(self, streams):
+        """Backfills the candles closed since the last one delivered of each stream, e.g. after a reconnection"""
+        now = int(time.time() * 1000)
+        for stream in streams:
+            sequence = self.sequences.get(stream)
+            if sequence is not None and sequence.last_open_time is not None:
+                await self.backfill(stream, sequence.last_open_time + sequence.step, now)
+
+    async def dispatch(self, message):
+        """Routes a combined stream message to the handler of its stream"""
+        if self.closed_only and is_interim(message):
+            return
+        try:
+            data = loads(message)
+            # Subscription responses ({"result": null, "id": n}) carry no stream
+            stream = data.get('stream')
+            if stream not in self.handlers:
+                return
+            kline = data['data']['k']
+            candle = (
+                kline['x'], kline['t'], kline['T'],
+                float(kline['o']), float(kline['h']), float(kline['l']), float(kline['c']), float(kline['v']),
+                stream_details(kline) if self.kline_record else None
+            )
+        except Exception as e:
+            # Malformed or unexpected messages are skipped
+            print(f"Error processing message {message[:200]!r}: {e!r}")
+            return
+
+        # Candles closed between the last one delivered and this one were missed
+        gap = self.sequences[stream].missing(candle[1])
+        if gap:
+            await self.backfill(stream, *gap)
+
+        await self.deliver(stream, *candle)
+
+    async def run(self):
+        """Waits until every connection is closed"""
+        while self.connections:
+            done, _ = await asyncio.wait(list(self.connections.values()), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    print(f"Connection stopped by an error: {task.exception()!r}")
+            self.connections = {connection: task for connection, task in self.connections.items() if not task.done()}
+
+    async def close(self):
+        for connection, task in list(self.connections.items()):
+            await connection.close()
+            # Connections waiting to reconnect are stopped right away
+            task.cancel()
+        await self.run()
+
+
+class BinanceSpotStreamMultiplexer(BinanceStreamMultiplexer):
+    """Combined streams for Binance spot market"""
+    MAX_STREAMS = 1024
+
+    def get_base_url(self) -> str:
+        return "wss://stream.binance.com:9443/stream"
+
+class BinanceFuturesStreamMultiplexer(BinanceStreamMultiplexer):
+    """Combined streams for Binance futures market"""
+    MAX_STREAMS = 200
+
+    def get_base_url(self) -> str:
+        return "wss://fstream.binance.com/stream"
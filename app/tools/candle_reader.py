@@ -0,0 +1,143 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from schema_manager import CANDLE_COLUMNS
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import io
+import uuid
+
+if TYPE_CHECKING:
+    # Annotations only: reading and parsing do not need the database driver imported
+    from connection_manager import PgConnecionManager
+
+# Responsible for reading candles from the fact tables straight into typed NumPy arrays,
+# so backtests do not go through CSV exports and per-column casts
+
+TIMESTAMP_COLUMNS = {'open_time', 'close_time'}
+INTEGER_COLUMNS = {'number_of_trades', 'ignore'}
+
+# Postgres binary timestamps are microseconds since 2000-01-01
+PG_EPOCH_US = 946_684_800_000_000
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+def column_dtype(column: str) -> str:
+    if column in TIMESTAMP_COLUMNS:
+        return 'datetime64[us]'
+    if column in INTEGER_COLUMNS:
+        return 'int64'
+    return 'float64'
+
+def column_array(column: str, values) -> np.ndarray:
+    # NULLs become NaN/NaT; integer columns holding them are read as float64
+    if column in INTEGER_COLUMNS and None in values:
+        return np.array(values, dtype='float64')
+    return np.array(values, dtype=column_dtype(column))
+
+def column_cast(column: str) -> str:
+    # Every column is read as an 8 byte type, so binary COPY rows have a fixed layout
+    if column in TIMESTAMP_COLUMNS:
+        return 'timestamp'
+    if column in INTEGER_COLUMNS:
+        return 'bigint'
+    return 'double precision'
+
+def parse_binary_copy(data: bytes, columns):
+    """
+    Parses the output of COPY ... TO STDOUT WITH (FORMAT binary) of 8 byte columns into arrays.
+    Returns None when the rows are not fixed length (NULL values), so the caller can fall back.
+    """
+    if not data.startswith(COPY_SIGNATURE):
+        raise ValueError("Not a binary COPY stream")
+    extension_length = int.from_bytes(data[15:19], 'big')
+    # Header: signature, flags and extension area. Trailer: a -1 field count
+    body = memoryview(data)[19 + extension_length:-2]
+
+    fields = [('fields', '>i2')]
+    for i, column in enumerate(columns):
+        fields += [(f'length_{i}', '>i4'), (column, '>f8' if column_dtype(column) == 'float64' else '>i8')]
+    row_dtype = np.dtype(fields)
+    if len(body) % row_dtype.itemsize:
+        return None
+
+    rows = np.frombuffer(body, dtype=row_dtype)
+    if (rows['fields'] != len(columns)).any() or any((rows[f'length_{i}'] != 8).any() for i in range(len(columns))):
+        return None
+
+    arrays = {}
+    for column in columns:
+        if column in TIMESTAMP_COLUMNS:
+            arrays[column] = (rows[column].astype(np.int64) + PG_EPOCH_US).view('datetime64[us]')
+        else:
+            arrays[column] = rows[column].astype(column_dtype(column))
+    return arrays
+
+
+class ReadQueriesManager:
+    def __init__(self, connection: PgConnecionManager, fact_table: str, chunk_size: int = 100_000):
+        """
+        :param chunk_size: Rows fetched per round trip when falling back to a server-side cursor.
+        """
+        self._connection = connection
+        self._fact = fact_table
+        self.chunk_size = chunk_size
+
+    def generate_query(self, columns) -> str:
+        select_string = ', '.join(f"{column}::{column_cast(column)} AS {column}" for column in columns)
+        return f"""
+        SELECT {select_string}
+        FROM public.{self._fact}
+        WHERE open_time >= %(start)s AND open_time < %(end)s
+        ORDER BY open_time
+        """
+
+    def _read_copy(self, conn, columns, params):
+        with conn.cursor() as cursor:
+            query = cursor.mogrify(self.generate_query(columns), params).decode()
+            buffer = io.BytesIO()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+        return parse_binary_copy(buffer.getvalue(), columns)
+
+    def _read_cursor(self, conn, columns, params):
+        chunks = {column: [] for column in columns}
+        # Named cursor: rows stay on the server and are fetched chunk_size at a time
+        with conn.cursor(name=f"candles_{uuid.uuid4().hex[:12]}") as cursor:
+            cursor.itersize = self.chunk_size
+            cursor.execute(self.generate_query(columns), params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                for column, values in zip(columns, zip(*rows)):
+                    chunks[column].append(column_array(column, values))
+        return {
+            column: np.concatenate(chunks[column]) if chunks[column] else np.empty(0, dtype=column_dtype(column))
+            for column in columns
+        }
+
+    def _read(self, conn, columns, params):
+        arrays = self._read_copy(conn, columns, params)
+        if arrays is None:
+            arrays = self._read_cursor(conn, columns, params)
+        conn.rollback()
+        return arrays
+
+    def read(self, start: datetime, end: datetime, columns=None) -> dict:
+        """
+        Candles with open_time in [start, end) as a dict of column name to NumPy array.
+
+        :param columns: Columns to read (e.g. ['open_time', 'high', 'low', 'close']), all by default.
+        """
+        columns = list(columns) if columns else [name for name, _ in CANDLE_COLUMNS]
+        params = {'start': start, 'end': end}
+        return self._connection.execute(lambda conn: self._read(conn, columns, params))
+
+    def read_df(self, start: datetime, end: datetime, columns=None) -> pd.DataFrame:
+        """
+        Same as read, as a DataFrame already in the types format_df produces (integer columns
+        holding NULLs are float64).
+        """
+        df = pd.DataFrame(self.read(start, end, columns), copy=False)
+        for column in TIMESTAMP_COLUMNS.intersection(df.columns):
+            df[column] = df[column].astype('datetime64[ns]')
+        return df
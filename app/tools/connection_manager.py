@@ -1,48 +1,173 @@
 import psycopg2
-from credential_manager import *
+import psycopg2.pool
+import threading
+import time
+from contextlib import contextmanager
+try:
+    from credential_manager import *
+except ImportError:
+    # Imported as tools.connection_manager (e.g. by the live uploader in app/)
+    from .credential_manager import *
 import binance.client as bclient
 
 class PgConnecionManager:
-    def __init__(self,credentials: PgCredentialsManager):
+    def __init__(self,credentials: PgCredentialsManager, minconn=1, maxconn=5, max_idle=300):
+        """
+        Pool of connections shared by the query managers, which borrow one per operation.
+
+        :param minconn: Connections opened by connect() and kept open while idle. Connections are
+            otherwise opened on demand.
+        :param maxconn: Maximum open connections, borrowers wait while all of them are in use.
+        :param max_idle: Seconds after which an idle connection above minconn is closed.
+        """
         self._credentials = credentials
-        self.connection = None
-        self.connect() 
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_idle = max_idle
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
     
     @property
     def is_connected(self):
-        return (
-            self.connection is not None 
-            and not self.connection.closed 
+        with self._condition:
+            return self._size > 0
+
+    def _new_connection(self):
+        return psycopg2.connect(
+            host=self._credentials.hostname,
+            database=self._credentials.database,
+            port=self._credentials.port,
+            user=self._credentials.username,
+            password=self._credentials.password
         )
 
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as e:
+            print(f"Error closing connection: {e}")
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _is_alive(self, connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap(self):
+        """Closes the connections idle for longer than max_idle, keeping minconn open"""
+        now = time.monotonic()
+        with self._condition:
+            expired = [item for item in self._idle if now - item[1] > self.max_idle]
+            expired = expired[:max(0, self._size - self.minconn)]
+            for item in expired:
+                self._idle.remove(item)
+        for connection, _ in expired:
+            self._close(connection)
+
     def disconnect(self):
-            
-        if self.connection:
-            try:
-                self.connection.close()
-            except Exception as e:
-                print(f"Error closing connection: {e}")
-            self.connection = None
+        """Closes the idle connections, borrowed ones are closed when given back"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
 
         if not self.is_connected:
             print("Disconnection successful")
 
-
     def connect(self):
-        if self.connection: self.disconnect()
-        
-        try:
-            self.connection = psycopg2.connect(
-                host=self._credentials.hostname,
-                database=self._credentials.database,
-                port=self._credentials.port,
-                user=self._credentials.username,
-                password=self._credentials.password
-            )
+        """Opens connections up to minconn"""
+        with self._condition:
+            missing = max(0, self.minconn - self._size)
+            self._size += missing
+
+        for _ in range(missing):
+            try:
+                connection = self._new_connection()
+            except psycopg2.Error as e:
+                print(f"Connection : {e}")
+                with self._condition:
+                    self._size -= 1
+                continue
+            self.putconn(connection)
+        if missing and self.is_connected:
             print("Connection sucessful")
-        except psycopg2.Error as e:
-            print(f"Connection : {e}")
-            self.connection = None
+
+    def getconn(self, timeout=None):
+        """Borrows a live connection, waiting up to timeout seconds while maxconn are in use"""
+        self._reap()
+        while True:
+            with self._condition:
+                if not self._idle and self._size >= self.maxconn:
+                    if not self._condition.wait_for(lambda: self._idle or self._size < self.maxconn, timeout):
+                        raise psycopg2.pool.PoolError("Connection pool exhausted")
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                else:
+                    connection = None
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    return self._new_connection()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+
+            # Connections dropped while idle (e.g. database restart) are replaced
+            if self._is_alive(connection):
+                return connection
+            self._close(connection)
+
+    def putconn(self, connection, close=False):
+        """Gives a borrowed connection back to the pool, discarding any uncommitted work"""
+        if close or connection.closed:
+            self._close(connection)
+            return
+        try:
+            if connection.status != psycopg2.extensions.STATUS_READY:
+                connection.rollback()
+        except psycopg2.Error:
+            self._close(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def borrow(self):
+        """Borrows a connection for the duration of the with block"""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def execute(self, func, retries=1):
+        """
+        Runs func(connection) on a borrowed connection. When the connection is lost
+        (e.g. a database restart) it is replaced by a new one and func is retried.
+        """
+        for attempt in range(retries + 1):
+            connection = self.getconn()
+            try:
+                return func(connection)
+            except psycopg2.OperationalError as e:
+                if not connection.closed or attempt == retries:
+                    raise
+                print(f"Connection lost, reconnecting: {e}")
+            finally:
+                self.putconn(connection)
 
     def __enter__(self):
         return self
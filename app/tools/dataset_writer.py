@@ -0,0 +1,334 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+import json
+import time
+import uuid
+import numpy as np
+import pandas as pd
+
+# Responsible for persisting extracted candles chunk by chunk, so downloads never need the whole date range in memory
+
+# Abstraction for dataset writers
+class DatasetWriter(ABC):
+    @abstractmethod
+    def write(self, df: pd.DataFrame):
+        pass
+
+    def compact(self):
+        """Merges what write appended into the final layout of the dataset, once a download ends"""
+        pass
+
+# Parquet dataset partitioned as <root>/symbol=<symbol>/interval=<interval>/month=<YYYY-MM>/.
+# Each chunk is written as a new part-<time>-<id>.parquet file of its months and compact() merges
+# the parts of a month into data.parquet. Readers concatenate data.parquet and the parts in
+# write order and deduplicate on the key, so the same candle written twice reads once.
+class ParquetDatasetWriter(DatasetWriter):
+    COMPACTED = 'data.parquet'
+
+    def __init__(self, root, symbol: str, interval: str, key: str = 'open_time'):
+        self.root = Path(root)
+        self.symbol = symbol
+        self.interval = interval
+        self.key = key
+        self.rows_written = 0
+        # Months with parts written by this writer, merged by compact()
+        self._touched = set()
+
+    def partition_dir(self, month: str) -> Path:
+        return self.root / f'symbol={self.symbol}' / f'interval={self.interval}' / f'month={month}'
+
+    def partition_path(self, month: str) -> Path:
+        return self.partition_dir(month) / self.COMPACTED
+
+    def partition_files(self, directory: Path) -> list:
+        """Files of a month partition, data.parquet first and then the parts in write order"""
+        parts = sorted(directory.glob('part-*.parquet'))
+        compacted = directory / self.COMPACTED
+        return ([compacted] if compacted.exists() else []) + parts
+
+    def _months(self) -> list:
+        return sorted((self.root / f'symbol={self.symbol}' / f'interval={self.interval}').glob('month=*'))
+
+    def _dedupe(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Rows are in write order, the last copy of a candle wins
+        return df.drop_duplicates(subset=self.key, keep='last').sort_values(self.key, kind='stable').reset_index(drop=True)
+
+    def format(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.rename(columns={col: col.lower().replace(' ', '_') for col in df.columns})
+        df[self.key] = pd.to_datetime(df[self.key])
+        return df
+
+    def write(self, df: pd.DataFrame):
+        """
+        Appends a chunk as one new part file per month it covers, so the cost of a write does not
+        depend on the rows already stored. Timestamps are kept in UTC.
+        """
+        if df.empty:
+            return
+
+        df = self.format(df)
+        months = df[self.key].dt.strftime('%Y-%m')
+        # Sortable by time, the id tells apart parts written in the same nanosecond
+        name = f'part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet'
+
+        for month, part in df.groupby(months):
+            directory = self.partition_dir(month)
+            directory.mkdir(parents=True, exist_ok=True)
+            self._write_file(part, directory / name)
+            self._touched.add(month)
+
+        self.rows_written += len(df)
+
+    def _write_file(self, df: pd.DataFrame, path: Path):
+        # Write to a temporary file first so an interrupted download never leaves a partial file
+        tmp_path = path.with_suffix('.tmp')
+        df.to_parquet(tmp_path, index=False)
+        tmp_path.replace(path)
+
+    def compact(self, months=None):
+        """
+        Merges the parts of each month (by default the months written by this writer) into a
+        deduplicated, sorted data.parquet and removes them. Parts written meanwhile are kept.
+        """
+        months = sorted(self._touched) if months is None else months
+        for month in months:
+            directory = self.partition_dir(month)
+            files = self.partition_files(directory)
+            parts = [path for path in files if path.name != self.COMPACTED]
+            if not parts:
+                continue
+            df = self._dedupe(pd.concat([pd.read_parquet(path) for path in files], ignore_index=True))
+            self._write_file(df, self.partition_path(month))
+            # A part left behind by an interruption here is read again after data.parquet, with the same rows
+            for path in parts:
+                path.unlink()
+            self._touched.discard(month)
+
+    def read(self, start=None, end=None, columns=None) -> pd.DataFrame:
+        """Reads back the dataset of the symbol/interval, optionally limited to [start, end) and to some columns"""
+        directories = self._months()
+
+        # Skip whole partitions outside the requested range
+        month = lambda directory: directory.name.split('=')[1]
+        if start is not None:
+            directories = [directory for directory in directories if month(directory) >= pd.Timestamp(start).strftime('%Y-%m')]
+        if end is not None:
+            directories = [directory for directory in directories if month(directory) <= pd.Timestamp(end).strftime('%Y-%m')]
+        paths = [path for directory in directories for path in self.partition_files(directory)]
+        if not paths:
+            return pd.DataFrame()
+
+        if columns is not None and self.key not in columns:
+            columns = [self.key] + list(columns)
+        df = self._dedupe(pd.concat([pd.read_parquet(path, columns=columns) for path in paths], ignore_index=True))
+        if start is not None:
+            df = df[df[self.key] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df[self.key] < pd.Timestamp(end)]
+        return df.reset_index(drop=True)
+
+    def coverage(self, start=None, end=None) -> np.ndarray:
+        """Stored open times as ms timestamps, reading only the key column"""
+        df = self.read(start, end, columns=[self.key])
+        if df.empty:
+            return np.empty(0, dtype=np.int64)
+        return df[self.key].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+
+
+# Columnar store of raw fixed-dtype arrays, one file per column, under <root>/symbol=<symbol>/interval=<interval>/.
+# header.json holds the dtypes, the committed row count and the file generation; files are only read
+# up to that count, so an interrupted append is invisible and overwritten by the next write. Rows are
+# kept sorted by open_time, which is the time index: slicing a range is a binary search plus zero-copy
+# views. Files are only ever appended to; rows older than the last stored one are merged by compact()
+# into files of a new generation, so views handed out earlier keep pointing at complete files.
+class MemmapCandleStore(DatasetWriter):
+    HEADER = 'header.json'
+    TIME_COLUMNS = ('open_time', 'close_time')
+
+    def __init__(self, root, symbol: str, interval: str, price_dtype: str = 'float64', max_pending_rows: int = 100_000):
+        """
+        :param price_dtype: dtype of prices and volumes for a new store ('float32' halves the size
+            at ~7 significant digits). Existing stores keep the dtypes of their header.
+        :param max_pending_rows: Out of order rows kept in memory before write compacts them into the store.
+        """
+        self.root = Path(root)
+        self.symbol = symbol
+        self.interval = interval
+        self.key = 'open_time'
+        self.rows_written = 0
+        self.path = self.root / f'symbol={symbol}' / f'interval={interval}'
+        self.max_pending_rows = max_pending_rows
+        self._maps = {}
+        # Chunks of rows older than the last stored open_time, waiting for compact()
+        self._pending = []
+        self.header = self._read_header() or {
+            'version': 1,
+            'symbol': symbol,
+            'interval': interval,
+            'rows': 0,
+            'columns': {
+                'open_time': 'int64',
+                'open': price_dtype,
+                'high': price_dtype,
+                'low': price_dtype,
+                'close': price_dtype,
+                'volume': price_dtype,
+                'close_time': 'int64',
+                'quote_asset_volume': price_dtype,
+                'number_of_trades': 'int32',
+                'taker_buy_base_volume': price_dtype,
+                'taker_buy_quote_volume': price_dtype,
+                'ignore': 'int8',
+            },
+        }
+
+    @property
+    def rows(self) -> int:
+        return self.header['rows']
+
+    @property
+    def columns(self):
+        return list(self.header['columns'])
+
+    def _read_header(self):
+        path = self.path / self.HEADER
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def _write_header(self, rows: int):
+        self.header['rows'] = rows
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path / (self.HEADER + '.tmp')
+        tmp_path.write_text(json.dumps(self.header, indent=2))
+        tmp_path.replace(self.path / self.HEADER)
+        self._maps = {}
+
+    @property
+    def generation(self) -> int:
+        return self.header.get('generation', 0)
+
+    def column_path(self, column: str, generation: int = None) -> Path:
+        generation = self.generation if generation is None else generation
+        return self.path / (f'{column}.{generation}.bin' if generation else f'{column}.bin')
+
+    def column(self, column: str) -> np.ndarray:
+        """Read-only memory map of a whole column"""
+        if column not in self._maps:
+            dtype = np.dtype(self.header['columns'][column])
+            if self.rows:
+                self._maps[column] = np.memmap(self.column_path(column), dtype=dtype, mode='r', shape=(self.rows,))
+            else:
+                self._maps[column] = np.empty(0, dtype=dtype)
+        return self._maps[column]
+
+    def format(self, df: pd.DataFrame) -> dict:
+        df = df.rename(columns={col: col.lower().replace(' ', '_') for col in df.columns})
+        arrays = {}
+        for column, dtype in self.header['columns'].items():
+            if column in self.TIME_COLUMNS:
+                arrays[column] = pd.to_datetime(df[column]).to_numpy(dtype='datetime64[ms]').astype(np.int64)
+            else:
+                arrays[column] = df[column].to_numpy(dtype=dtype)
+        return arrays
+
+    def _sorted_unique(self, arrays: dict) -> dict:
+        # Last occurrence of each open_time wins, as in ParquetDatasetWriter
+        open_time = arrays[self.key][::-1]
+        _, index = np.unique(open_time, return_index=True)
+        index = len(open_time) - 1 - index
+        return {column: values[index] for column, values in arrays.items()}
+
+    @property
+    def pending_rows(self) -> int:
+        return sum(len(chunk[self.key]) for chunk in self._pending)
+
+    def write(self, df: pd.DataFrame):
+        """
+        Appends the rows of a chunk newer than the last stored open_time. Older rows (re-runs, out
+        of order workers) are queued and merged by compact(), they are not visible to reads until then.
+        """
+        if df.empty:
+            return
+
+        new = self._sorted_unique(self.format(df))
+        if self.rows:
+            late = new[self.key] <= self.column(self.key)[-1]
+            if late.any():
+                self._pending.append({column: values[late] for column, values in new.items()})
+                new = {column: values[~late] for column, values in new.items()}
+        if len(new[self.key]):
+            self._append(new)
+        self.rows_written += len(df)
+
+        if self.pending_rows > self.max_pending_rows:
+            self.compact()
+
+    def _append(self, new: dict):
+        self.path.mkdir(parents=True, exist_ok=True)
+        for column in self.columns:
+            path = self.column_path(column)
+            itemsize = np.dtype(self.header['columns'][column]).itemsize
+            with open(path, 'r+b' if path.exists() else 'wb') as file:
+                # Drops what an interrupted append left after the committed rows, never committed rows
+                file.truncate(self.rows * itemsize)
+                file.seek(self.rows * itemsize)
+                new[column].tofile(file)
+        self._write_header(self.rows + len(new[self.key]))
+
+    def compact(self):
+        """
+        Merges the queued out of order rows, the last copy of an open_time winning. The rows from
+        the first queued open_time on are rewritten into files of a new generation, committed by
+        the header, so arrays returned before keep their data and new reads see the merged store.
+        """
+        if not self._pending:
+            return
+
+        pending = self._sorted_unique({column: np.concatenate([chunk[column] for chunk in self._pending]) for column in self.columns})
+        start = int(np.searchsorted(self.column(self.key), pending[self.key][0], side='left'))
+        merged = self._sorted_unique({column: np.concatenate((self.column(column)[start:], pending[column])) for column in self.columns})
+
+        old_generation, generation = self.generation, self.generation + 1
+        for column in self.columns:
+            with open(self.column_path(column, generation), 'wb') as file:
+                self.column(column)[:start].tofile(file)
+                merged[column].tofile(file)
+        self.header['generation'] = generation
+        self._write_header(start + len(merged[self.key]))
+        self._pending = []
+
+        # Mapped views of the old files stay valid after the unlink
+        for column in self.columns:
+            self.column_path(column, old_generation).unlink(missing_ok=True)
+
+    def _slice(self, start=None, end=None) -> slice:
+        open_time = self.column(self.key)
+        first = 0 if start is None else int(np.searchsorted(open_time, _to_ms(start), side='left'))
+        last = self.rows if end is None else int(np.searchsorted(open_time, _to_ms(end), side='left'))
+        return slice(first, last)
+
+    def read_arrays(self, start=None, end=None, columns=None) -> dict:
+        """Zero-copy views of the columns for open times in [start, end). Times are int64 ms"""
+        rows = self._slice(start, end)
+        return {column: self.column(column)[rows] for column in (columns or self.columns)}
+
+    def read(self, start=None, end=None, columns=None) -> pd.DataFrame:
+        """Same as read_arrays as a DataFrame, with datetime open/close times like ParquetDatasetWriter.read"""
+        if columns is not None and self.key not in columns:
+            columns = [self.key] + list(columns)
+        arrays = self.read_arrays(start, end, columns)
+        for column in self.TIME_COLUMNS:
+            if column in arrays:
+                arrays[column] = arrays[column].astype('datetime64[ms]')
+        return pd.DataFrame(arrays)
+
+    def coverage(self, start=None, end=None) -> np.ndarray:
+        """Stored open times as ms timestamps"""
+        return self.read_arrays(start, end, columns=[self.key])[self.key]
+
+
+def _to_ms(value) -> int:
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 1_000_000)
@@ -1,33 +1,35 @@
 from connection_manager import *
+from schema_manager import SchemaQueriesManager
 import pandas as pd
+import psycopg2
+from psycopg2 import extras
+import io
+import time
+import uuid
 
 class TruncateQueriesManager:
     def __init__(self,connection :PgConnecionManager, prefact_table: str):
         self._connection = connection
         self._prefact = prefact_table
         self.query = None
-        self.conn = connection.connection
         self.generate_query()
 
     def generate_query(self):
         self.query = f"TRUNCATE TABLE public.{self._prefact};"
 
+    def _truncate_table(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(self.query)
+        conn.commit()
+
     def truncate_table(self):
-        
+        # Uncommitted work of a failed operation is rolled back when the connection returns to the pool
         try:
-            conn = self.conn
-            cursor = conn.cursor()
-            cursor.execute(self.query)
-            conn.commit()
+            self._connection.execute(self._truncate_table)
 
         except Exception as e:
-            conn.rollback()
             print(f"An error occurred during data truncation: {e}")
 
-        finally:
-            if cursor:
-                cursor.close()
-
 
 class InsertQueriesManager:
     def __init__(self,df: pd.DataFrame, connection: PgConnecionManager, prefact_table: str):
@@ -35,7 +37,7 @@ class InsertQueriesManager:
         self._connection = connection
         self._prefact = prefact_table
         self.query = None
-        self.conn = connection.connection
+        self.copy_query = None
         self.generate_query()
 
     def generate_query(self):
@@ -44,33 +46,41 @@ class InsertQueriesManager:
         columns_string = ', '.join(format_columns)
         primary_key = format_columns[0]
 
+        # Fallback for tables that already hold some of the rows: COPY cannot skip conflicts
         self.query = f"""
         INSERT INTO public.{self._prefact}(
         {columns_string})
-        VALUES ({('%s,'*len(columns))[:-1]})
+        VALUES %s
         ON CONFLICT ({primary_key}) DO NOTHING;
         """
 
+        self.copy_query = f"COPY public.{self._prefact} ({columns_string}) FROM STDIN WITH (FORMAT csv)"
+
+    def csv_buffer(self, df: pd.DataFrame) -> io.StringIO:
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        return buffer
+
+    def _insert_data(self, conn, df: pd.DataFrame):
+        with conn.cursor() as cursor:
+            try:
+                cursor.copy_expert(self.copy_query, self.csv_buffer(df))
+            except psycopg2.errors.UniqueViolation:
+                conn.rollback()
+                extras.execute_values(cursor, self.query, df.itertuples(index=False, name=None), page_size=1000)
+        conn.commit()
 
     def insert_data(self):
+        # Keep the first row of each key, as ON CONFLICT DO NOTHING would
+        df = self._df.drop_duplicates(subset=self._df.columns[0])
         try:
-            conn = self.conn
-            cursor = conn.cursor()
-
-            for index, row in self._df.iterrows():
-                data =[row[col] for col in self._df.columns]
-                cursor.execute(self.query, data)
-            conn.commit()
-            print(f'\n\t{index+1} rows inserted')
+            self._connection.execute(lambda conn: self._insert_data(conn, df))
+            print(f'\n\t{len(df)} rows inserted')
 
         except Exception as e:
-            conn.rollback()
             print(f"An error occurred during data insertion: {e}")
 
-        finally:
-            if cursor:
-                cursor.close()
-
 class MergeQueriesManager:
     def __init__(self,df: pd.DataFrame, connection: PgConnecionManager, prefact_table: str ,fact_table: str):
         self._df = df
@@ -78,7 +88,8 @@ class MergeQueriesManager:
         self._fact = fact_table
         self._prefact = prefact_table
         self.query = None
-        self.conn = connection.connection
+        self.bounds_query = None
+        self.matched_query = None
         self.generate_query()
 
     def generate_query(self):
@@ -86,18 +97,34 @@ class MergeQueriesManager:
         columns = list(self._df.columns)
         format_columns = [item.lower().replace(' ', '_') for item in columns]
         primary_key = format_columns[0]
+        value_columns = format_columns[1:]
 
-        update_set = ", ".join([f"{col}=src.{col}" for col in format_columns])
+        update_set = ", ".join([f"{col}=src.{col}" for col in value_columns])
+        changed = f"({', '.join([f'lve.{col}' for col in value_columns])}) IS DISTINCT FROM ({', '.join([f'src.{col}' for col in value_columns])})"
 
         insert_columns = ", ".join(format_columns)
         insert_values = ", ".join([f"src.{col}" for col in format_columns])
 
+        # Time window of the batch, passed to the merge as constants so only the fact rows
+        # (and partitions) inside it are scanned
+        self.bounds_query = f"SELECT MIN({primary_key}), MAX({primary_key}), COUNT(*) FROM {self._prefact};"
+
+        self.matched_query = f"""
+        SELECT COUNT(*)
+        FROM {self._prefact} AS src
+        JOIN {self._fact} AS lve
+        ON lve.{primary_key} = src.{primary_key}
+        AND lve.{primary_key} BETWEEN %(start)s AND %(end)s;
+        """
+
+        # Rows already stored with the same values are left untouched, so re-sent candles cost no writes
         self.query = f"""
         MERGE INTO {self._fact} AS lve
         USING {self._prefact} AS src
         ON lve.{primary_key} = src.{primary_key}
+        AND lve.{primary_key} BETWEEN %(start)s AND %(end)s
 
-        WHEN MATCHED THEN
+        WHEN MATCHED AND {changed} THEN
             UPDATE SET 
             {update_set}
 
@@ -106,25 +133,129 @@ class MergeQueriesManager:
             VALUES ({insert_values});
         """
 
+    def _merge_data(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(self.bounds_query)
+            start, end, total = cursor.fetchone()
+            if not total:
+                return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+            params = {'start': start, 'end': end}
+            cursor.execute(self.matched_query, params)
+            matched = cursor.fetchone()[0]
+            cursor.execute(self.query, params)
+            # MERGE only reports the rows it wrote: every unmatched row is inserted, the rest of them are updates
+            written = cursor.rowcount
+        conn.commit()
+
+        inserted = total - matched
+        updated = written - inserted
+        return {'inserted': inserted, 'updated': updated, 'unchanged': matched - updated}
+
     def merge_data(self):
-    
+        """Merges the prefact table into the fact table, returns the inserted/updated/unchanged row counts"""
         try:
-            conn = self.conn
-            cursor = conn.cursor()
-            cursor.execute(self.query)
-            conn.commit()
+            counts = self._connection.execute(self._merge_data)
+            print(f"\n\t{counts['inserted']} rows inserted, {counts['updated']} updated, {counts['unchanged']} unchanged")
+            return counts
 
         except Exception as e:
-            conn.rollback()
             print(f"An error occurred during data merge: {e}")
 
-        finally:
-            if cursor:
-                cursor.close()
+# Staging tables older than this are leftovers of loads that were killed before dropping them
+STALE_STAGING_SECONDS = 24 * 3600
+
+class StagingQueriesManager:
+    def __init__(self, connection: PgConnecionManager, fact_table: str, max_age: float = STALE_STAGING_SECONDS):
+        self._connection = connection
+        self._fact = fact_table
+        self.prefix = f"{fact_table}_stage_"
+        # Unique per load, so several loaders can stage data for the same fact table at once.
+        # The creation time tells the tables of running loads apart from leftovers
+        self.table = f"{self.prefix}{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        self.max_age = max_age
+        self.create_query = None
+        self.drop_query = None
+        self.stale_query = None
+        self.generate_query()
+
+    def generate_query(self):
+        # UNLOGGED: staging rows are disposable, so they are not written to the WAL.
+        # Unlike a TEMP table it is visible from every pooled connection the load borrows
+        self.create_query = f"CREATE UNLOGGED TABLE public.{self.table} (LIKE public.{self._fact} INCLUDING DEFAULTS);"
+        self.drop_query = f"DROP TABLE IF EXISTS public.{self.table};"
+        # '_' is a LIKE wildcard
+        self.stale_query = "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename LIKE %(pattern)s;"
+
+    def _run(self, conn, query):
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+        conn.commit()
+
+    def stale_tables(self, tables, now: float = None) -> list:
+        """
+        Staging tables of the fact table created more than max_age seconds ago. Tables named
+        without their creation time come from older versions and are always stale
+        """
+        now = time.time() if now is None else now
+        stale = []
+        for table in tables:
+            if not table.startswith(self.prefix) or table == self.table:
+                continue
+            parts = table[len(self.prefix):].split('_')
+            if len(parts) != 2 or not parts[0].isdigit() or now - int(parts[0]) > self.max_age:
+                stale.append(table)
+        return stale
+
+    def _drop_stale_tables(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(self.stale_query, {'pattern': self.prefix.replace('_', '\\_') + '%'})
+            tables = self.stale_tables([row[0] for row in cursor.fetchall()])
+            for table in tables:
+                cursor.execute(f"DROP TABLE IF EXISTS public.{table};")
+        conn.commit()
+        return tables
+
+    def create_table(self):
+        try:
+            self._connection.execute(lambda conn: self._run(conn, self.create_query))
+
+        except Exception as e:
+            print(f"An error occurred during staging table creation: {e}")
+
+    def drop_table(self):
+        try:
+            self._connection.execute(lambda conn: self._run(conn, self.drop_query))
+
+        except Exception as e:
+            print(f"An error occurred during staging table drop: {e}")
+
+    def drop_stale_tables(self):
+        """Drops the staging tables left behind by killed loads (see stale_tables)"""
+        try:
+            tables = self._connection.execute(self._drop_stale_tables)
+            if tables:
+                print(f"Dropped {len(tables)} staging tables left by interrupted loads")
+
+        except Exception as e:
+            print(f"An error occurred dropping stale staging tables: {e}")
 
 class QueriesManager:
-    def __init__(self, df:pd.DataFrame, connection:PgConnecionManager, prefact_table:str, fact_table:str):
-        self._truncateManager = TruncateQueriesManager(connection, prefact_table)
+    def __init__(self, df:pd.DataFrame, connection:PgConnecionManager, prefact_table:str, fact_table:str, staging:bool=False, partitioned:bool=False):
+        """
+        :param staging: Load through a staging table created for this load instead of truncating
+            the shared prefact table (prefact_table is then ignored), so loaders can run concurrently.
+        :param partitioned: The fact table is managed by SchemaQueriesManager, the table and the
+            monthly partitions of the loaded rows are created before merging.
+        """
+        self._df = df
+        self._schemaManager = SchemaQueriesManager(connection, fact_table) if partitioned else None
+        self._stagingManager = None
+        if staging:
+            self._stagingManager = StagingQueriesManager(connection, fact_table)
+            prefact_table = self._stagingManager.table
+        else:
+            self._truncateManager = TruncateQueriesManager(connection, prefact_table)
         self._insertManager = InsertQueriesManager(df, connection, prefact_table)
         self._mergeManager = MergeQueriesManager(df, connection, prefact_table,fact_table)
 
@@ -135,9 +266,25 @@ class QueriesManager:
         self._insertManager.insert_data()
 
     def merge_data(self):
-        self._mergeManager.merge_data()
+        return self._mergeManager.merge_data()
+
+    def migrate(self):
+        open_times = self._df[self._df.columns[0]]
+        self._schemaManager.migrate(open_times.min(), open_times.max() + pd.Timedelta(1, 'us'))
 
     def process_data(self):
-        self.truncate_data()
-        self.insert_data()
-        self.merge_data()
\ No newline at end of file
+        if self._schemaManager is not None and not self._df.empty:
+            self.migrate()
+
+        if self._stagingManager is None:
+            self.truncate_data()
+            self.insert_data()
+            return self.merge_data()
+
+        self._stagingManager.drop_stale_tables()
+        self._stagingManager.create_table()
+        try:
+            self.insert_data()
+            return self.merge_data()
+        finally:
+            self._stagingManager.drop_table()
\ No newline at end of file
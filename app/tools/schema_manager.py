@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from datetime import datetime
+
+if TYPE_CHECKING:
+    from connection_manager import PgConnecionManager
+
+# Responsible for the schema of the candle fact tables: one table per symbol and interval,
+# range partitioned by month on open_time, so merges and range scans only touch the
+# partitions of the months involved instead of the whole history
+
+CANDLE_COLUMNS = [
+    ('open_time', 'timestamp NOT NULL'),
+    ('open', 'double precision'),
+    ('high', 'double precision'),
+    ('low', 'double precision'),
+    ('close', 'double precision'),
+    ('volume', 'double precision'),
+    ('close_time', 'timestamp'),
+    ('quote_asset_volume', 'double precision'),
+    ('number_of_trades', 'bigint'),
+    ('taker_buy_base_volume', 'double precision'),
+    ('taker_buy_quote_volume', 'double precision'),
+    ('ignore', 'integer'),
+]
+
+def fact_table_name(symbol: str, interval: str, market: str = 'futures') -> str:
+    """e.g. ('BTCUSDT', '5m') -> btcusdtfutures_5m. Monthly candles ('1M') use 'mo' so they do not clash with minutes"""
+    if interval.endswith('M'):
+        interval = interval[:-1] + 'mo'
+    return f"{symbol}{market}_{interval}".lower()
+
+def month_starts(start: datetime, end: datetime):
+    """First day of every month overlapping [start, end)"""
+    month = datetime(start.year, start.month, 1)
+    months = []
+    while month < end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+class SchemaQueriesManager:
+    def __init__(self, connection: PgConnecionManager, fact_table: str):
+        self._connection = connection
+        self._fact = fact_table
+        self.create_query = None
+        self.index_query = None
+        self.generate_query()
+
+    def generate_query(self):
+        columns_string = ',\n            '.join(f"{name} {definition}" for name, definition in CANDLE_COLUMNS)
+
+        # The primary key includes the partition key, so every partition gets its own unique index
+        self.create_query = f"""
+        CREATE TABLE IF NOT EXISTS public.{self._fact} (
+            {columns_string},
+            PRIMARY KEY (open_time)
+        ) PARTITION BY RANGE (open_time);
+        """
+
+        # Candles are appended in open_time order, so a BRIN index stays tiny and prunes range scans well
+        self.index_query = f"""
+        CREATE INDEX IF NOT EXISTS {self._fact}_open_time_brin
+        ON public.{self._fact} USING BRIN (open_time);
+        """
+
+    def partition_name(self, month: datetime) -> str:
+        return f"{self._fact}_{month.strftime('%Y_%m')}"
+
+    def partition_query(self, month: datetime) -> str:
+        return f"""
+        CREATE TABLE IF NOT EXISTS public.{self.partition_name(month)}
+        PARTITION OF public.{self._fact}
+        FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}');
+        """
+
+    def _run(self, conn, queries):
+        with conn.cursor() as cursor:
+            for query in queries:
+                cursor.execute(query)
+        conn.commit()
+
+    def create_table(self):
+        try:
+            self._connection.execute(lambda conn: self._run(conn, [self.create_query, self.index_query]))
+
+        except Exception as e:
+            print(f"An error occurred during table creation: {e}")
+
+    def create_partitions(self, start: datetime, end: datetime):
+        """Creates the monthly partitions covering [start, end). Existing partitions are kept"""
+        queries = [self.partition_query(month) for month in month_starts(start, end)]
+        try:
+            self._connection.execute(lambda conn: self._run(conn, queries))
+
+        except Exception as e:
+            print(f"An error occurred during partition creation: {e}")
+
+    def migrate(self, start: datetime, end: datetime):
+        """Creates the fact table if needed and the partitions a load of [start, end) writes into"""
+        self.create_table()
+        self.create_partitions(start, end)
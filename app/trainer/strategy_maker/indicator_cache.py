@@ -0,0 +1,105 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas_ta as ta
+import pandas as pd
+import numpy as np
+
+# Memoization layer for pandas_ta indicators used by the strategies.
+# Results are keyed by (series fingerprint, indicator, parameters), so an optimizer sweep that
+# evaluates the same EMA lengths thousands of times only computes each one once.
+
+def _digest(item) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    values = np.ascontiguousarray(np.asarray(item, dtype=np.float64))
+    digest.update(str(values.shape).encode())
+    digest.update(values.tobytes())
+    if isinstance(item, pd.Series) and len(item):
+        digest.update(str((item.index[0], item.index[-1])).encode())
+    return digest.hexdigest()
+
+def fingerprint(*series) -> str:
+    """Content hash of one or more series (values and index bounds)"""
+    return '-'.join(_digest(item) for item in series)
+
+def frame_fingerprints(data: pd.DataFrame, *columns) -> dict:
+    """
+    fingerprint of each column, so the indicators of one call hash every column once,
+    e.g. the close shared by several EMAs and the ADX
+    """
+    return {column: fingerprint(data[column]) for column in columns}
+
+
+class IndicatorCache:
+    def __init__(self, maxsize: int = 512, max_bytes: int = 512 * 1024**2):
+        """
+        Bounded LRU cache of indicator arrays.
+
+        :param maxsize: Maximum number of cached indicators.
+        :param max_bytes: Maximum memory used by the cached arrays.
+        """
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = compute()
+        for array in (value.values() if isinstance(value, dict) else [value]):
+            array.flags.writeable = False
+
+        with self._lock:
+            self.misses += 1
+            if key not in self._entries:
+                self._entries[key] = value
+                self.nbytes += self._size(value)
+                self._evict()
+        return value
+
+    def _size(self, value) -> int:
+        return sum(a.nbytes for a in value.values()) if isinstance(value, dict) else value.nbytes
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.maxsize or self.nbytes > self.max_bytes):
+            _, value = self._entries.popitem(last=False)
+            self.nbytes -= self._size(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'nbytes': self.nbytes}
+
+    ### Indicators
+
+    # key identifies the input series instead of hashing them: their fingerprint computed once for
+    # several indicators, or a caller-chosen key (e.g. symbol, interval and range) for data the
+    # caller guarantees is not modified
+
+    def ema(self, close: pd.Series, length: int = 10, key: str = None) -> pd.Series:
+        key = (key or fingerprint(close), 'ema', length)
+        values = self.get(key, lambda: ta.ema(close, length=length).to_numpy(dtype=np.float64))
+        return pd.Series(values, index=close.index, name=f'EMA_{length}')
+
+    def adx(self, high: pd.Series, low: pd.Series, close: pd.Series, length: int = 14, key: str = None) -> pd.DataFrame:
+        key = (key or fingerprint(high, low, close), 'adx', length)
+        columns = self.get(key, lambda: {col: values.to_numpy(dtype=np.float64)
+                                         for col, values in ta.adx(high=high, low=low, close=close, length=length).items()})
+        return pd.DataFrame(columns, index=close.index)
+
+
+# Shared cache used by the strategies
+cached = IndicatorCache()
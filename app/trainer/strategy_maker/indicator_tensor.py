@@ -0,0 +1,114 @@
+import pandas_ta as ta
+import pandas as pd
+import numpy as np
+from .indicator_cache import cached, fingerprint
+
+# Precomputed indicators for a whole parameter grid.
+# Every length an optimizer can ask for is computed once before the search starts and stored as
+# a contiguous float64 matrix (lengths x bars), so evaluating a candidate is row indexing plus
+# comparisons.
+
+# Default memory limit of a tensor, checked before a matrix is allocated
+MAX_TENSOR_BYTES = 2 * 1024**3
+
+def _ema(data: pd.DataFrame, length: int) -> np.ndarray:
+    return ta.ema(data['close'], length=length).to_numpy(dtype=np.float64)
+
+def _adx(data: pd.DataFrame, length: int) -> np.ndarray:
+    adx_df = ta.adx(high=data['high'], low=data['low'], close=data['close'], length=length)
+    return adx_df['ADX_'+str(length)].to_numpy(dtype=np.float64)
+
+def _cached_ema(data: pd.DataFrame, length: int, key: str) -> np.ndarray:
+    return cached.ema(data['close'], length, key=key).to_numpy()
+
+def _cached_adx(data: pd.DataFrame, length: int, key: str) -> np.ndarray:
+    return cached.adx(high=data['high'], low=data['low'], close=data['close'], length=length, key=key)['ADX_'+str(length)].to_numpy()
+
+
+class IndicatorTensor:
+    # indicator name: (precompute function, on demand function, input columns)
+    INDICATORS = {
+        'ema': (_ema, _cached_ema, ('close',)),
+        'adx': (_adx, _cached_adx, ('high', 'low', 'close')),
+    }
+
+    def __init__(self, data: pd.DataFrame, max_bytes: int = MAX_TENSOR_BYTES):
+        """
+        :param max_bytes: Memory limit of all the matrices, a build going over it raises ValueError
+            instead of allocating them.
+        """
+        self._data = data
+        self.n_bars = len(data)
+        self.max_bytes = max_bytes
+        self.matrices = {}
+        self.rows = {}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(matrix.nbytes for matrix in self.matrices.values())
+
+    def build(self, indicator: str, lengths, cache: bool = False):
+        """
+        Computes the indicator for every length into a single (lengths x bars) matrix.
+        With cache=True the rows go through the shared indicator cache, which pays off when the
+        same lengths are requested again by later builds.
+        """
+        precompute, on_demand, columns = IndicatorTensor.INDICATORS[indicator]
+        if cache:
+            # The input columns are hashed once per build, not once per length
+            key = self._key(columns)
+            compute = lambda data, length: on_demand(data, length, key)
+        else:
+            compute = precompute
+        lengths = sorted({int(length) for length in lengths})
+        # A rebuilt indicator replaces its previous matrix
+        other_bytes = sum(matrix.nbytes for name, matrix in self.matrices.items() if name != indicator)
+        nbytes = len(lengths) * self.n_bars * np.dtype(np.float64).itemsize
+        if other_bytes + nbytes > self.max_bytes:
+            raise ValueError(f"The {indicator} tensor of {len(lengths)} lengths x {self.n_bars} bars needs {nbytes / 1024**2:.1f} MiB, "
+                             f"over the {self.max_bytes / 1024**2:.1f} MiB limit. Reduce the parameter ranges or the data, or raise max_bytes")
+        matrix = np.empty((len(lengths), self.n_bars), dtype=np.float64)
+        for i, length in enumerate(lengths):
+            matrix[i] = compute(self._data, length)
+
+        self.matrices[indicator] = matrix
+        self.rows[indicator] = {length: i for i, length in enumerate(lengths)}
+        return self
+
+    def get(self, indicator: str, length) -> np.ndarray:
+        """Row of the precomputed matrix, falling back to the indicator cache for lengths outside the grid"""
+        row = self.rows.get(indicator, {}).get(int(length))
+        if row is not None:
+            return self.matrices[indicator][row]
+        _, on_demand, columns = IndicatorTensor.INDICATORS[indicator]
+        return on_demand(self._data, int(length), self._key(columns))
+
+    def _key(self, columns) -> str:
+        return fingerprint(*(self._data[column] for column in columns))
+
+    def ema(self, length) -> np.ndarray:
+        return self.get('ema', length)
+
+    def adx(self, length) -> np.ndarray:
+        return self.get('adx', length)
+
+
+def build_indicator_tensor(data: pd.DataFrame, requirements: dict, param_ranges: dict, defaults: dict = None, cache: bool = False,
+                           max_bytes: int = MAX_TENSOR_BYTES) -> IndicatorTensor:
+    """
+    Builds the indicator tensor of a strategy for a parameter grid.
+
+    :param requirements: Indicator name to the strategy parameters holding its length,
+        e.g. {'ema': ['fast_EMA', 'slow_EMA', 'long_EMA'], 'adx': ['ADX_period']}.
+    :param param_ranges: Parameter ranges of the optimizer.
+    :param defaults: Values used for parameters that are not part of param_ranges.
+    :param max_bytes: Memory limit of the tensor (see IndicatorTensor).
+    """
+    defaults = defaults or {}
+    tensor = IndicatorTensor(data, max_bytes)
+    for indicator, params in requirements.items():
+        lengths = set()
+        for param in params:
+            lengths.update(param_ranges[param] if param in param_ranges else [defaults[param]])
+        tensor.build(indicator, lengths, cache=cache)
+    return tensor
@@ -0,0 +1,107 @@
+import math
+
+# Indicators updated one candle at a time in O(1), for live trading.
+# They follow the pandas_ta definitions used by the backtests (indicator_cache), so the newest value
+# matches the last row of ta.ema / ta.adx computed over the whole history.
+
+class IncrementalEWM:
+    """Newest value of pandas Series.ewm(alpha, adjust, min_periods).mean(), NaN observations included"""
+    def __init__(self, alpha: float, adjust: bool = True, min_periods: int = 0):
+        self.alpha = alpha
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.value = math.nan
+        self._weighted = math.nan
+        self._old_wt = 1.0
+        self._nobs = 0
+
+    def update(self, x: float) -> float:
+        # Same recurrence as the pandas ewma kernel (ignore_na=False)
+        is_observation = x == x
+        self._nobs += is_observation
+        if self._weighted == self._weighted:
+            self._old_wt *= 1 - self.alpha
+            if is_observation:
+                new_wt = 1.0 if self.adjust else self.alpha
+                if self._weighted != x:
+                    self._weighted = (self._old_wt * self._weighted + new_wt * x) / (self._old_wt + new_wt)
+                self._old_wt = self._old_wt + new_wt if self.adjust else 1.0
+        elif is_observation:
+            self._weighted = x
+
+        self.value = self._weighted if self._nobs >= self.min_periods else math.nan
+        return self.value
+
+
+class IncrementalEMA:
+    """pandas_ta ema: SMA of the first length closes as seed, then ewm(span=length, adjust=False)"""
+    def __init__(self, length: int):
+        self.length = length
+        self.value = math.nan
+        self._ewm = IncrementalEWM(alpha=2 / (length + 1), adjust=False)
+        self._count = 0
+        self._sum = 0.0
+
+    def update(self, close: float) -> float:
+        self._count += 1
+        if self._count < self.length:
+            self._sum += close
+            return self.value
+        if self._count == self.length:
+            close = (self._sum + close) / self.length
+        self.value = self._ewm.update(close)
+        return self.value
+
+    def on_candle(self, high: float, low: float, close: float) -> float:
+        return self.update(close)
+
+
+def rma(length: int) -> IncrementalEWM:
+    """pandas_ta rma: ewm(alpha=1/length, min_periods=length) with the pandas default adjust=True"""
+    return IncrementalEWM(alpha=1 / length, adjust=True, min_periods=length)
+
+
+class IncrementalADX:
+    """
+    pandas_ta adx (rma smoothing, drift 1). pandas_ta adds float epsilon to every high-low range of
+    the series when any of them is zero; here it is only added to the zero ones, which stays within
+    floating point tolerance.
+    """
+    def __init__(self, length: int = 14, lensig: int = None, scalar: float = 100):
+        self.length = length
+        self.scalar = scalar
+        self.value = math.nan
+        self.dmp = math.nan
+        self.dmn = math.nan
+        self._atr = rma(length)
+        self._pos = rma(length)
+        self._neg = rma(length)
+        self._adx = rma(lensig or length)
+        self._previous = None
+
+    def update(self, high: float, low: float, close: float) -> float:
+        if self._previous is None:
+            true_range = pos = neg = math.nan
+        else:
+            prev_high, prev_low, prev_close = self._previous
+            high_low = (high - low) or 2.220446049250313e-16
+            true_range = max(abs(high_low), abs(high - prev_close), abs(prev_close - low))
+            up = high - prev_high
+            dn = prev_low - low
+            pos = up if up > dn and up > 0 else 0.0
+            neg = dn if dn > up and dn > 0 else 0.0
+        self._previous = (high, low, close)
+
+        atr = self._atr.update(true_range)
+        pos = self._pos.update(pos)
+        neg = self._neg.update(neg)
+        k = self.scalar / atr if atr else math.nan
+        self.dmp = k * pos
+        self.dmn = k * neg
+        total = self.dmp + self.dmn
+        dx = self.scalar * abs(self.dmp - self.dmn) / total if total else math.nan
+        self.value = self._adx.update(dx)
+        return self.value
+
+    def on_candle(self, high: float, low: float, close: float) -> float:
+        return self.update(high, low, close)
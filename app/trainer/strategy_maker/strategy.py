@@ -1,6 +1,22 @@
-import pandas_ta as ta
 import pandas as pd
 import numpy as np
+from .indicator_cache import cached, frame_fingerprints
+from .indicator_tensor import build_indicator_tensor
+from .live_indicators import IncrementalEMA, IncrementalADX
+
+# Indicators (and the parameters holding their lengths) and default parameters of EMADX_strategy
+EMADX_INDICATORS = {'ema': ('fast_EMA', 'slow_EMA', 'long_EMA'), 'adx': ('ADX_period',)}
+EMADX_DEFAULTS = {'fast_EMA': 9, 'slow_EMA': 21, 'long_EMA': 200, 'ADX_thresh': 25, 'ADX_period': 14}
+
+def EMADX_signal(ema_fast, ema_slow, ema_long, adx, ADX_thresh):
+    """Buy (1) / sell (-1) / hold (0) rule shared by EMADX_strategy and EMADX_batch_signals"""
+    return np.where(
+        (ema_fast > ema_slow) & (adx > ADX_thresh) & (ema_fast > ema_long) & (ema_slow > ema_long), 1,#buy signal
+        np.where(
+            (ema_fast < ema_slow) & (adx > ADX_thresh) & (ema_fast < ema_long) & (ema_slow < ema_long), -1,#sell signal
+            0
+        )
+    )
 
 def EMADX_strategy(data,fast_EMA=9,slow_EMA=21, long_EMA = 200 ,ADX_thresh=25,ADX_period=14):
     """
@@ -13,23 +29,61 @@ def EMADX_strategy(data,fast_EMA=9,slow_EMA=21, long_EMA = 200 ,ADX_thresh=25,AD
     - Otherwise, no signal.
     """
     df = data.copy()
+    # Each input column is hashed once for the cache keys of all the indicators
+    keys = frame_fingerprints(data, 'high', 'low', 'close')
+    close_key = keys['close']
     #EMA CALC default is 9 for fast and 21 for slow
-    df['EMA_fast'] = ta.ema(df['close'], length=fast_EMA)
-    df['EMA_slow'] = ta.ema(df['close'], length=slow_EMA)
-    df['EMA_long'] = ta.ema(df['close'], length=long_EMA)
-    
+    df['EMA_fast'] = cached.ema(df['close'], fast_EMA, key=close_key)
+    df['EMA_slow'] = cached.ema(df['close'], slow_EMA, key=close_key)
+    df['EMA_long'] = cached.ema(df['close'], long_EMA, key=close_key)
+
     # ADX
-    adx_df = ta.adx(high=df['high'], low=df['low'], close=df['close'])
+    adx_df = cached.adx(high=df['high'], low=df['low'], close=df['close'], key='-'.join(keys.values()))
     colname = 'ADX_'+str(ADX_period)
     df['ADX'] = adx_df[colname]
-    
-    df['Signal'] = np.where(
-        (df['EMA_fast'] > df['EMA_slow']) & (df['ADX'] > ADX_thresh) & (df['EMA_fast'] > df['EMA_long']) & (df['EMA_slow'] > df['EMA_long']), 1,#buy signal
-        np.where(
-            (df['EMA_fast'] < df['EMA_slow']) & (df['ADX'] > ADX_thresh) & (df['EMA_fast'] < df['EMA_long']) &(df['EMA_slow'] < df['EMA_long']), -1,#sell signal
-            0
-        )
-    )
-    
-    
-    return df
\ No newline at end of file
+
+    df['Signal'] = EMADX_signal(df['EMA_fast'], df['EMA_slow'], df['EMA_long'], df['ADX'], ADX_thresh)
+
+
+    return df
+
+def EMADX_batch_signals(data, param_list, indicators=None):
+    """
+    Signal matrix (n_params x n_bars) of EMADX_strategy for every parameter set in param_list.
+
+    The candidates are evaluated on the rows of an indicator tensor, without copying the
+    DataFrame. Pass the tensor returned by EMADX_precompute to skip indicator computation
+    entirely; otherwise each distinct EMA length and ADX period in the batch is computed once.
+    """
+    if indicators is None:
+        grid = {param: [params.get(param, default) for params in param_list] for param, default in EMADX_DEFAULTS.items()}
+        indicators = build_indicator_tensor(data, EMADX_INDICATORS, grid, cache=True)
+
+    signals = np.zeros((len(param_list), len(data)), dtype=np.int8)
+    for i, params in enumerate(param_list):
+        p = {**EMADX_DEFAULTS, **params}
+        signals[i] = EMADX_signal(indicators.ema(p['fast_EMA']), indicators.ema(p['slow_EMA']), indicators.ema(p['long_EMA']),
+                                  indicators.adx(p['ADX_period']), p['ADX_thresh'])
+    return signals
+
+def EMADX_precompute(data, param_ranges):
+    """Indicator tensor with every EMA length and ADX period of an optimizer's parameter ranges"""
+    return build_indicator_tensor(data, EMADX_INDICATORS, param_ranges, EMADX_DEFAULTS)
+
+def EMADX_live_indicators(fast_EMA=9, slow_EMA=21, long_EMA=200, ADX_period=14, **kwargs):
+    """Incremental updaters of the EMADX_strategy indicators, named as its DataFrame columns (e.g. for a CandleRingBuffer)"""
+    return {
+        'EMA_fast': IncrementalEMA(fast_EMA),
+        'EMA_slow': IncrementalEMA(slow_EMA),
+        'EMA_long': IncrementalEMA(long_EMA),
+        'ADX': IncrementalADX(ADX_period),
+    }
+
+def EMADX_live_signal(values, ADX_thresh=25, **kwargs):
+    """Signal of the newest candle from the newest indicator values (e.g. CandleRingBuffer.latest_values())"""
+    return int(EMADX_signal(values['EMA_fast'], values['EMA_slow'], values['EMA_long'], values['ADX'], ADX_thresh))
+
+EMADX_strategy.batch_signals = EMADX_batch_signals
+EMADX_strategy.precompute = EMADX_precompute
+EMADX_strategy.live_indicators = EMADX_live_indicators
+EMADX_strategy.live_signal = EMADX_live_signal
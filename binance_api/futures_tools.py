@@ -1,5 +1,8 @@
 from binance.client import Client
 import psycopg2
+from psycopg2 import extras
+import io
+import uuid
 import time
 import pandas as pd
 import json
@@ -42,6 +45,31 @@ def insert_to_db(candle,conn,cursor,table_name):
     cursor.execute(query, candle)
     conn.commit()
 
+CANDLE_COLUMNS = ('open_time, open, high, low, close, volume, close_time, quote_asset_volume, '
+                  'number_of_trades, taker_buy_base_volume, taker_buy_quote_volume, ignore')
+
+def insert_many_to_db(df,conn,cursor,table_name):
+    """
+    Loads a whole candles DataFrame (api_to_df layout) in one transaction with COPY.
+    Falls back to a paged INSERT ... ON CONFLICT DO NOTHING when the table already holds some of the candles.
+    """
+    # Keep the first candle of each open time, as ON CONFLICT DO NOTHING would
+    df = df.drop_duplicates(subset=df.columns[0])
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    try:
+        cursor.copy_expert(f"COPY public.{table_name} ({CANDLE_COLUMNS}) FROM STDIN WITH (FORMAT csv)", buffer)
+    except psycopg2.errors.UniqueViolation:
+        conn.rollback()
+        query = f"""
+            INSERT INTO public.{table_name}({CANDLE_COLUMNS})
+            VALUES %s
+            ON CONFLICT (open_time) DO NOTHING;
+        """
+        extras.execute_values(cursor, query, df.itertuples(index=False, name=None), page_size=1000)
+    conn.commit()
+
 def truncate_table(table_name,conn,cursor):
     truncate_query = f"TRUNCATE TABLE public.{table_name};"
     cursor.execute(truncate_query)
@@ -49,15 +77,81 @@ def truncate_table(table_name,conn,cursor):
     conn.commit()
     
 
+# Staging tables older than this are leftovers of loads that were killed before dropping them
+STALE_STAGING_SECONDS = 24 * 3600
+
+def create_staging_table(table_name,conn,cursor):
+    """
+    Creates an UNLOGGED copy of table_name used by a single load and returns its name.
+    The name is unique, so several loaders can stage data for the same table at once, and
+    carries the creation time so drop_stale_staging_tables can tell leftovers apart.
+    """
+    staging_table_name = f"{table_name}_stage_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    cursor.execute(f"CREATE UNLOGGED TABLE public.{staging_table_name} (LIKE public.{table_name} INCLUDING DEFAULTS);")
+    conn.commit()
+    return staging_table_name
+
+def drop_staging_table(staging_table_name,conn,cursor):
+    # Discard whatever a failed load left in the transaction before dropping
+    conn.rollback()
+    cursor.execute(f"DROP TABLE IF EXISTS public.{staging_table_name};")
+    conn.commit()
+
+def drop_stale_staging_tables(table_name,conn,cursor,max_age=STALE_STAGING_SECONDS):
+    """
+    Drops the staging tables of table_name created more than max_age seconds ago by loads that
+    were killed before their drop. Tables named without their creation time come from older
+    versions and are always dropped. Returns the dropped table names.
+    """
+    prefix = f"{table_name}_stage_"
+    # '_' is a LIKE wildcard
+    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename LIKE %s;", (prefix.replace('_', '\\_') + '%',))
+    now = time.time()
+    stale = []
+    for (staging_table_name,) in cursor.fetchall():
+        parts = staging_table_name[len(prefix):].split('_')
+        if len(parts) != 2 or not parts[0].isdigit() or now - int(parts[0]) > max_age:
+            stale.append(staging_table_name)
+    for staging_table_name in stale:
+        cursor.execute(f"DROP TABLE IF EXISTS public.{staging_table_name};")
+    conn.commit()
+    return stale
+
 def merge_tables(source_table_name,live_table_name,conn,cursor):
-    truncate_query = f"""
+    """
+    Upserts the source table into the live table, limited to the time window of the source rows.
+    Candles already stored with the same values are not rewritten. Returns the inserted/updated/unchanged counts.
+    """
+    cursor.execute(f"SELECT MIN(open_time), MAX(open_time), COUNT(*) FROM {source_table_name};")
+    start, end, total = cursor.fetchone()
+    if not total:
+        conn.commit()
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    params = {'start': start, 'end': end}
+
+    cursor.execute(f"""
+    SELECT COUNT(*)
+    FROM {source_table_name} AS src
+    JOIN {live_table_name} AS lve
+    ON lve.open_time = src.open_time
+    AND lve.open_time BETWEEN %(start)s AND %(end)s;
+    """, params)
+    matched = cursor.fetchone()[0]
+
+    merge_query = f"""
     MERGE INTO {live_table_name} AS lve
     USING {source_table_name} AS src
     ON lve.open_time = src.open_time
+    AND lve.open_time BETWEEN %(start)s AND %(end)s
     
-    WHEN MATCHED THEN
+    WHEN MATCHED AND (
+        lve.open, lve.high, lve.low, lve.close, lve.volume, lve.close_time, lve.quote_asset_volume,
+        lve.number_of_trades, lve.taker_buy_base_volume, lve.taker_buy_quote_volume, lve.ignore
+    ) IS DISTINCT FROM (
+        src.open, src.high, src.low, src.close, src.volume, src.close_time, src.quote_asset_volume,
+        src.number_of_trades, src.taker_buy_base_volume, src.taker_buy_quote_volume, src.ignore
+    ) THEN
         UPDATE SET 
-        open_time=src.open_time, 
         open=src.open, 
         high=src.high, 
         low=src.low, 
@@ -86,10 +180,16 @@ def merge_tables(source_table_name,live_table_name,conn,cursor):
         src.taker_buy_quote_volume, 
         src.ignore);
     """
-    cursor.execute(truncate_query)
-    print(cursor.statusmessage)
+    cursor.execute(merge_query, params)
+    written = cursor.rowcount
     conn.commit()
 
+    inserted = total - matched
+    updated = written - inserted
+    counts = {'inserted': inserted, 'updated': updated, 'unchanged': matched - updated}
+    print(f"{inserted} inserted, {updated} updated, {counts['unchanged']} unchanged")
+    return counts
+
 def api_to_df(klines,columns):
     df = pd.DataFrame(klines, columns=columns)
 
@@ -132,3 +232,30 @@ def get_latest_date(table_name,conn,cursor):
     oldest_date = cursor.fetchone()[0]
     return oldest_date
 
+
+def get_missing_ranges(table_name, start, end, step, cursor):
+    """Missing [start, end) candle ranges of a table, read from the open_time index"""
+    params = {'start': start, 'end': end, 'step': step}
+    cursor.execute(f"""
+        SELECT MIN(open_time), MAX(open_time) FROM public.{table_name}
+        WHERE open_time >= %(start)s AND open_time < %(end)s;
+    """, params)
+    first, last = cursor.fetchone()
+    if first is None:
+        return [(start, end)]
+
+    gaps = [(start, first)] if first > start else []
+    cursor.execute(f"""
+        SELECT open_time + %(step)s, next_open_time
+        FROM (
+            SELECT open_time, LEAD(open_time) OVER (ORDER BY open_time) AS next_open_time
+            FROM public.{table_name}
+            WHERE open_time >= %(start)s AND open_time < %(end)s
+        ) AS coverage
+        WHERE next_open_time > open_time + %(step)s
+        ORDER BY 1;
+    """, params)
+    gaps.extend(cursor.fetchall())
+    if last + step < end:
+        gaps.append((last + step, end))
+    return gaps
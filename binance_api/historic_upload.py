@@ -1,5 +1,5 @@
 from futures_tools import *
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 if __name__=='__main__':
 
@@ -47,11 +47,16 @@ if __name__=='__main__':
 
 
     # Table name
-    source_table_name = 'btcusdtfutures_historic'
     live_table_name = 'btcusdtfutures_live'
     # Currency params
     symbol = 'BTCUSDT'  # trading currency
     interval = Client.KLINE_INTERVAL_5MINUTE  # time interval
+    step = timedelta(minutes=5)  # time between candles of the interval
+
+    # Staging tables of loads killed before their drop
+    stale_tables = drop_stale_staging_tables(live_table_name,conn,cursor)
+    if stale_tables:
+        print(f"Dropped {len(stale_tables)} staging tables left by interrupted loads")
     
     start_date = '2025-01-25'
     stop_date = '2024-01-25'
@@ -63,24 +68,28 @@ if __name__=='__main__':
 
         while initial_date != stop_date:
             end_date = (datetime.strptime(initial_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-            print(f"Loading data: from {end_date} to {initial_date}")
-            #Truncate source table
-            truncate_table(source_table_name,conn,cursor)
-
-            #Extract data from api
-            last_candles = get_historic_candles(symbol,end_date,initial_date,interval, client)
-            #Insert data into historic
-            for index, row in last_candles.iterrows():
-                candle =(
-                    row['Open Time'], row['Open'], row['High'], 
-                    row['Low'], row['Close'],row['Volume'], 
-                    row['Close Time'], row['Quote Asset Volume'],
-                    row['Number of Trades'], row['Taker Buy Base Volume'],
-                    row['Taker Buy Quote Volume'], row['Ignore']
-                    )
-                insert_to_db(candle,conn,cursor,source_table_name)
-
-            merge_tables(source_table_name,live_table_name,conn,cursor)
+            # Only request the candles missing in the live table for this day
+            gaps = get_missing_ranges(live_table_name, datetime.strptime(end_date, "%Y-%m-%d"), datetime.strptime(initial_date, "%Y-%m-%d"), step, cursor)
+            if not gaps:
+                print(f"Data from {end_date} to {initial_date} already loaded")
+                initial_date = end_date
+                continue
+
+            print(f"Loading data: from {end_date} to {initial_date} ({len(gaps)} missing ranges)")
+            #Create a staging table for this load
+            staging_table_name = create_staging_table(live_table_name,conn,cursor)
+            try:
+                for gap_start, gap_end in gaps:
+                    #Extract data from api, open times are stored in UTC and the range end is exclusive
+                    gap_start_ms = int(gap_start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+                    gap_end_ms = int(gap_end.replace(tzinfo=timezone.utc).timestamp() * 1000) - 1
+                    last_candles = get_historic_candles(symbol,gap_start_ms,gap_end_ms,interval, client)
+                    #Insert data into staging
+                    insert_many_to_db(last_candles,conn,cursor,staging_table_name)
+
+                merge_tables(staging_table_name,live_table_name,conn,cursor)
+            finally:
+                drop_staging_table(staging_table_name,conn,cursor)
 
             #Reload date
             initial_date = end_date
@@ -1,6 +1,8 @@
 from futures_tools import *
 from datetime import datetime
 
+# Polling loader, superseded by app/live_upload.py which upserts the candles from the WebSocket in micro-batches
+
 if __name__=='__main__':
 
     ###########################################
@@ -45,7 +47,6 @@ if __name__=='__main__':
     ###########################################
 
     # Table name
-    source_table_name = 'btcusdtfutures_source'
     live_table_name = 'btcusdtfutures_live'
     # Currency params
     symbol = 'BTCUSDT'  # trading currency
@@ -56,25 +57,18 @@ if __name__=='__main__':
     try:
         while True:
             print("===============================",datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            #Truncate source table
-            truncate_table(source_table_name,conn,cursor)
+            #Create a staging table for this load
+            staging_table_name = create_staging_table(live_table_name,conn,cursor)
+            try:
+                #Extract data from api
+                last_candles = get_last_candles(symbol,limit,interval,client)
 
-            #Extract data from api
-            last_candles = get_last_candles(symbol,limit,interval,client)
-            
-            #Insert data into source
-            counter = 0
-            for index, row in last_candles.iterrows():
-                candle =(
-                    row['Open Time'], row['Open'], row['High'], 
-                    row['Low'], row['Close'],row['Volume'], 
-                    row['Close Time'], row['Quote Asset Volume'],
-                    row['Number of Trades'], row['Taker Buy Base Volume'],
-                    row['Taker Buy Quote Volume'], row['Ignore']
-                    )
-                insert_to_db(candle,conn,cursor,source_table_name)
+                #Insert data into staging
+                insert_many_to_db(last_candles,conn,cursor,staging_table_name)
 
-            merge_tables(source_table_name,live_table_name,conn,cursor)
+                merge_tables(staging_table_name,live_table_name,conn,cursor)
+            finally:
+                drop_staging_table(staging_table_name,conn,cursor)
             
             print(f"Updated ")
             # wait 1 minute for next update
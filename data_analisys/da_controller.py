@@ -80,10 +80,99 @@ class BasicBuyer:
 
 
 
+## VECTORIZED ENGINE
+
+def position_state(signals, prices):
+    """
+    Resolves the long/flat state machine of BasicBuyer for every bar without a Python loop.
+
+    A buy event is a bar with signal 1, a sell event is a bar with signal -1 and a valid price.
+    The position after each bar is the last event seen so far, so it is obtained by forward
+    filling the index of the latest event. Works on the last axis, so 2-D (n_params x n_bars)
+    signal matrices are resolved in a single pass.
+
+    Returns the (in_position, entries, exits) boolean arrays.
+    """
+    signals = np.asarray(signals)
+    prices = np.asarray(prices, dtype=np.float64)
+    events = np.where(signals == 1, 1, np.where((signals == -1) & ~np.isnan(prices), -1, 0)).astype(np.int8)
+
+    bars = np.arange(signals.shape[-1])
+    last_event = np.maximum.accumulate(np.where(events != 0, bars, -1), axis=-1)
+    in_position = np.take_along_axis(events, np.maximum(last_event, 0), axis=-1) == 1
+    in_position &= last_event >= 0
+
+    previous = np.zeros_like(in_position)
+    previous[..., 1:] = in_position[..., :-1]
+    entries = in_position & ~previous
+    exits = previous & ~in_position
+    return in_position, entries, exits
+
+
+def trade_multipliers(prices, entries, exits, trade_comission=None):
+    """
+    Returns, for every bar, the factor applied to the funds when a trade is closed on it
+    (1 on bars without an exit) together with the raw trade rates (sell/buy, NaN elsewhere).
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    bars = np.arange(entries.shape[-1])
+    last_entry = np.maximum.accumulate(np.where(entries, bars, 0), axis=-1)
+    entry_prices = np.take_along_axis(np.broadcast_to(prices, entries.shape), last_entry, axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(exits, prices / entry_prices, np.nan)
+    fee = (1 - trade_comission)**2 if trade_comission else 1
+    multipliers = np.where(exits, rates * fee, 1.0)
+    return multipliers, rates, entry_prices
+
+
+def max_streak(mask):
+    """Longest run of consecutive True values in a 1-D boolean array"""
+    if not mask.size:
+        return 0
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return int((edges[1::2] - edges[::2]).max()) if edges.size else 0
+
+
+def vectorized_trades(signals, prices, funds=100, trade_comission=None):
+    """
+    NumPy counterpart of the BasicBuyer loop. Returns the funds curve per bar and the same
+    statistics BasicBuyer accumulates trade by trade.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    _, entries, exits = position_state(signals, prices)
+    multipliers, rates, entry_prices = trade_multipliers(prices, entries, exits, trade_comission)
+
+    funds_curve = funds * np.cumprod(multipliers)
+    trade_rates = rates[exits]
+    trade_rates = trade_rates[~np.isnan(trade_rates)]
+    equity = funds_curve[exits]
+    wins = prices[exits] > entry_prices[exits]
+
+    return {
+        'funds_curve': funds_curve,
+        'final_funds': funds_curve[-1] if funds_curve.size else funds,
+        'total_trades': int(exits.sum()),
+        'win_count': int(wins.sum()),
+        'lose_count': int((~wins).sum()),
+        'max_trade_rate': max(1, trade_rates.max()) if trade_rates.size else 1,
+        'min_trade_rate': min(1, trade_rates.min()) if trade_rates.size else 1,
+        'max_winstreak': max_streak(wins),
+        'max_losestreak': max_streak(~wins),
+        'max_drawdown': np.minimum(funds, equity.min()) if equity.size else funds,
+    }
+
+
 class SpotTradeAnalyzer:
-    def __init__(self, strategy_signals: pd.DataFrame, name: str='Strategy',trade_comission=None):
+    ENGINES = ('loop', 'vectorized')
+
+    def __init__(self, strategy_signals: pd.DataFrame, name: str='Strategy',trade_comission=None, engine: str='loop'):
+        if engine not in SpotTradeAnalyzer.ENGINES:
+            raise ValueError(f"Unknown engine: {engine}. Available engines: {SpotTradeAnalyzer.ENGINES}")
         self.name = name
         self.data = strategy_signals
+        self.engine = engine
         self.buyer = BasicBuyer(trade_comission=trade_comission) 
         self.total_trades = 0
         self.results ={}
@@ -92,6 +181,32 @@ class SpotTradeAnalyzer:
         self.set_results()
 
     def check_strategy(self):
+        if self.engine == 'vectorized':
+            self.check_strategy_vectorized()
+        else:
+            self.check_strategy_loop()
+
+    def check_strategy_vectorized(self):
+        buyer = self.buyer
+        trades = vectorized_trades(self.data['signal'].values, self.data['close'].values,
+                                   funds=buyer.funds, trade_comission=buyer.trade_comission)
+
+        # Load the results into the buyer so set_results works for both engines
+        buyer.funds = trades['final_funds']
+        buyer.win_count = trades['win_count']
+        buyer.lose_count = trades['lose_count']
+        buyer.max_trade_rate = trades['max_trade_rate']
+        buyer.min_trade_rate = trades['min_trade_rate']
+        buyer.max_winstreak = trades['max_winstreak']
+        buyer.max_losestreak = trades['max_losestreak']
+        buyer.max_drawdown = trades['max_drawdown']
+        self.total_trades = trades['total_trades']
+
+        returns = pd.DataFrame({'open_time': self.data['open_time'].values, 'funds': trades['funds_curve']})
+        returns['open_time'] = pd.to_datetime(returns['open_time'])
+        self.returns_chart = returns
+
+    def check_strategy_loop(self):
         signals = self.data['signal'].values
         prices = self.data['close'].values
         funds = [0] * len(signals)
@@ -196,16 +311,16 @@ def format_df(df):
     df['ignore'] = df['ignore'].astype(int)
     return df
 
-def detailed_backtest(df, strategy, **kwargs):
+def detailed_backtest(df, strategy, engine='loop', **kwargs):
     strategy_df = strategy(df, **kwargs)
-    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__)
+    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__,engine=engine)
     trade_analyzer.print_results()
     trade_analyzer.plot_performance()
     #trade_analyzer.plot_strategy_signals()
 
-def detailed_true_backtest(df, strategy, trade_comission=0.001,**kwargs):
+def detailed_true_backtest(df, strategy, trade_comission=0.001, engine='loop', **kwargs):
     strategy_df = strategy(df, **kwargs)
-    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__,trade_comission=trade_comission)
+    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__,trade_comission=trade_comission,engine=engine)
     trade_analyzer.print_results()
     trade_analyzer.plot_performance()
     #trade_analyzer.plot_strategy_signals()
@@ -215,12 +330,50 @@ def plot_strategy_signals(df, strategy, **kwargs):
     trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__)
     trade_analyzer.plot_strategy_signals()
 
-def backtest(df, strategy, **kwargs):
+def backtest(df, strategy, engine='loop', **kwargs):
     strategy_df = strategy(df, **kwargs)
-    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__)
+    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__,engine=engine)
     return trade_analyzer.results['Final funds']
 
-def true_backtest(df, strategy, trade_comission=0.001,**kwargs):
+def true_backtest(df, strategy, trade_comission=0.001, engine='loop', **kwargs):
     strategy_df = strategy(df, **kwargs)
-    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__,trade_comission=trade_comission)
-    return trade_analyzer.results['Final funds']
\ No newline at end of file
+    trade_analyzer = SpotTradeAnalyzer(strategy_df,name=strategy.__name__,trade_comission=trade_comission,engine=engine)
+    return trade_analyzer.results['Final funds']
+
+def batch_signals(df, strategy, param_list, indicators=None):
+    """
+    Signal matrix (n_params x n_bars) for every candidate in param_list. Strategies exposing a
+    batch_signals(df, param_list) attribute build it directly from arrays, reading from the
+    precomputed indicators when given; any other strategy is evaluated candidate by candidate
+    and its signal columns are stacked.
+    """
+    strategy_batch = getattr(strategy, 'batch_signals', None)
+    if strategy_batch is not None:
+        kwargs = {'indicators': indicators} if indicators is not None else {}
+        return np.asarray(strategy_batch(df, param_list, **kwargs), dtype=np.int8)
+    return np.vstack([strategy(df, **params)['signal'].to_numpy(dtype=np.int8) for params in param_list])
+
+def simulate_batch(signals, prices, funds=100, trade_comission=None, chunk_size=None):
+    """Final funds of every row of a signal matrix, simulated chunk_size rows at a time"""
+    signals = np.atleast_2d(signals)
+    prices = np.asarray(prices, dtype=np.float64)
+    chunk_size = chunk_size or len(signals)
+    final_funds = np.empty(len(signals), dtype=np.float64)
+
+    for start in range(0, len(signals), chunk_size):
+        chunk = signals[start:start + chunk_size]
+        _, entries, exits = position_state(chunk, prices)
+        multipliers, _, _ = trade_multipliers(prices, entries, exits, trade_comission)
+        final_funds[start:start + chunk_size] = funds * np.prod(multipliers, axis=-1)
+
+    return final_funds
+
+def batch_backtest(df, strategy, param_list, trade_comission=0.001, chunk_size=None, indicators=None):
+    """
+    Evaluates a whole population of parameter sets in one call and returns the final funds of
+    each one as a fitness vector, in the same order as param_list. Use trade_comission=None for
+    the equivalent of backtest, chunk_size to bound memory on long histories and indicators to
+    reuse the tensor built by an optimizer's precompute_indicators.
+    """
+    signals = batch_signals(df, strategy, param_list, indicators=indicators)
+    return simulate_batch(signals, df['close'].values, trade_comission=trade_comission, chunk_size=chunk_size)
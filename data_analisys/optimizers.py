@@ -1,9 +1,27 @@
 import numpy as np
 from typing import Dict, List, Any
-import random
 import itertools
 from tqdm import tqdm
 import time
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Optimizer worker state, loaded once per process by the pool initializer
+_worker = {}
+
+def _init_worker(data, strategy, fitness_function):
+    _worker['data'] = data
+    _worker['strategy'] = strategy
+    _worker['fitness_function'] = fitness_function
+
+def _evaluate_params(params):
+    return _worker['fitness_function'](_worker['data'], _worker['strategy'], **params)
+
+def _evaluate_grid_chunk(param_names, start, chunk):
+    return start, [(values, _evaluate_params(dict(zip(param_names, values)))) for values in chunk]
 
 
 class GeneticOptimizer:
@@ -14,7 +32,8 @@ class GeneticOptimizer:
         elite_size: int = 5,
         mutation_rate: float = 0.2,
         mutation_strength: float = 0.3,
-        tournament_size: int = 3
+        tournament_size: int = 3,
+        cache_fitness: bool = True
     ):
         self.parameter_ranges = parameter_ranges
         self.population_size = population_size
@@ -24,72 +43,257 @@ class GeneticOptimizer:
         self.tournament_size = tournament_size
         self.best_fitness_history = []
         self.diversity_history = []
+        self.cache_fitness = cache_fitness
+        self.fitness_cache = {}
+        self.cache_history = []
+        self._pool = None
+        self.compile_ranges()
         
+    def precompute_indicators(self, data, strategy):
+        """
+        Computes, before the search starts, every indicator the strategy can need for the
+        parameter ranges (strategies exposing a precompute attribute). Pass the result to
+        batch_backtest(..., indicators=...) so each evaluation is indexing plus comparisons.
+        """
+        precompute = getattr(strategy, 'precompute', None)
+        return precompute(data, self.parameter_ranges) if precompute else None
+
+    def individual_key(self, individual: Dict) -> tuple:
+        """Canonical parameter tuple of an individual, in parameter_ranges order"""
+        return tuple(individual[key] for key in self.parameter_ranges)
+
+    def evaluate_population(self, fitness_function, population: List[Dict]) -> List[float]:
+        """
+        Fitness of every individual. Individuals already scored (elites, repeated children)
+        are read from the fitness cache and only novel ones are sent to fitness_function.
+        fitness_function may return None for individuals it could not score (e.g. evaluation
+        timeouts); they get -inf fitness but are not cached, so they are evaluated again if
+        they come back.
+        """
+        if not self.cache_fitness:
+            return [float('-inf') if result is None else result for result in fitness_function(population)]
+
+        keys = [self.individual_key(ind) for ind in population]
+        novel = {}
+        for key, ind in zip(keys, population):
+            if key not in self.fitness_cache and key not in novel:
+                novel[key] = ind
+
+        unscored = set()
+        if novel:
+            results = fitness_function(list(novel.values()))
+            for key, result in zip(novel.keys(), results):
+                if result is None:
+                    unscored.add(key)
+                else:
+                    self.fitness_cache[key] = result
+
+        self.cache_history.append({'hits': len(population) - len(novel), 'misses': len(novel)})
+        return [float('-inf') if key in unscored else self.fitness_cache[key] for key in keys]
+
+    def compile_ranges(self):
+        """
+        Precompiles every parameter range into a sorted NumPy array plus a value to index dict.
+        Individuals are handled internally as integer index vectors over these arrays, so a
+        whole generation is a (population x parameters) matrix.
+        """
+        self.param_names = list(self.parameter_ranges.keys())
+        self.values = []
+        self.value_index = []
+        for key in self.param_names:
+            values = np.asarray(list(self.parameter_ranges[key]))
+            if np.issubdtype(values.dtype, np.number):
+                values = np.sort(values)
+            self.values.append(values)
+            self.value_index.append({value: i for i, value in enumerate(values.tolist())})
+        self.range_sizes = np.array([len(values) for values in self.values])
+        self.numeric = [np.issubdtype(values.dtype, np.number) for values in self.values]
+
+    def encode(self, population: List[Dict]) -> np.ndarray:
+        return np.array([[self.value_index[j][ind[key]] for j, key in enumerate(self.param_names)]
+                         for ind in population], dtype=np.int64).reshape(len(population), len(self.param_names))
+
+    def decode(self, indices: np.ndarray) -> List[Dict]:
+        columns = [self.values[j][indices[:, j]] for j in range(len(self.param_names))]
+        return [dict(zip(self.param_names, row)) for row in zip(*columns)]
+
+    def random_indices(self, n: int) -> np.ndarray:
+        return (np.random.random((n, len(self.param_names))) * self.range_sizes).astype(np.int64)
+
+    def nearest_index(self, j: int, value: np.ndarray) -> np.ndarray:
+        """Index of the closest valid value of parameter j (the lower one on ties)"""
+        values = self.values[j]
+        right = np.clip(np.searchsorted(values, value), 0, len(values) - 1)
+        left = np.clip(right - 1, 0, len(values) - 1)
+        return np.where(np.abs(value - values[left]) <= np.abs(values[right] - value), left, right)
+
+    def population_diversity(self, indices: np.ndarray) -> float:
+        diversity = 0
+        for j in range(len(self.param_names)):
+            diversity += len(np.unique(indices[:, j])) / self.range_sizes[j]
+        return diversity / len(self.param_names)
+
+    def select_indices(self, fitness_values: np.ndarray, n: int) -> np.ndarray:
+        """Winners of n tournaments of tournament_size distinct individuals"""
+        tournaments = np.random.random((n, len(fitness_values))).argsort(axis=1)[:, :self.tournament_size]
+        return tournaments[np.arange(n), np.argmax(fitness_values[tournaments], axis=1)]
+
+    def mutate_indices(self, indices: np.ndarray, diversity: float) -> np.ndarray:
+        # Increase mutation rate when diversity is low
+        adaptive_rate = self.mutation_rate * (1 + (1 - diversity))
+        mutate = np.random.random(indices.shape) < adaptive_rate
+
+        # Calculate mutation step size based on diversity
+        step_size = (self.range_sizes * self.mutation_strength * (1 + (1 - diversity))).astype(np.int64)
+        step = np.floor(np.random.random(indices.shape) * (2 * step_size + 1)).astype(np.int64) - step_size
+
+        # Apply circular mutation to stay within bounds
+        return np.where(mutate, (indices + step) % self.range_sizes, indices)
+
+    def crossover_indices(self, parents1: np.ndarray, parents2: np.ndarray) -> np.ndarray:
+        children = np.where(np.random.random(parents1.shape) < 0.5, parents1, parents2)
+        for j, values in enumerate(self.values):
+            # Arithmetic crossover for numeric parameters, snapped to the nearest valid value
+            if self.numeric[j]:
+                weight = np.random.random(len(parents1))
+                value = values[parents1[:, j]] * weight + values[parents2[:, j]] * (1 - weight)
+                if np.issubdtype(values.dtype, np.integer):
+                    value = np.trunc(value)
+                children[:, j] = self.nearest_index(j, value)
+        return children
+
     def generate_population(self) -> List[Dict]:
-        return [
-            {key: np.random.choice(list(self.parameter_ranges[key]))
-             for key in self.parameter_ranges.keys()}
-            for _ in range(self.population_size)
-        ]
+        return self.decode(self.random_indices(self.population_size))
     
     def calculate_population_diversity(self, population: List[Dict]) -> float:
-        diversity = 0
-        for key in self.parameter_ranges.keys():
-            values = [ind[key] for ind in population]
-            diversity += len(set(values)) / len(self.parameter_ranges[key])
-        return diversity / len(self.parameter_ranges)
+        return self.population_diversity(self.encode(population))
     
     def tournament_selection(self, population: List[Dict], fitness_values: List[float]) -> Dict:
-        tournament_idx = random.sample(range(len(population)), self.tournament_size)
-        tournament_fitness = [fitness_values[i] for i in tournament_idx]
-        winner_idx = tournament_idx[np.argmax(tournament_fitness)]
+        winner_idx = self.select_indices(np.asarray(fitness_values, dtype=np.float64), 1)[0]
         return population[winner_idx]
     
     def adaptive_mutation(self, individual: Dict, diversity: float) -> Dict:
-        mutated = individual.copy()
-        # Increase mutation rate when diversity is low
-        adaptive_rate = self.mutation_rate * (1 + (1 - diversity))
-        
-        for key in mutated.keys():
-            if random.random() < adaptive_rate:
-                current_idx = list(self.parameter_ranges[key]).index(mutated[key])
-                range_size = len(self.parameter_ranges[key])
-                
-                # Calculate mutation step size based on diversity
-                step_size = int(range_size * self.mutation_strength * (1 + (1 - diversity)))
-                step = random.randint(-step_size, step_size)
-                
-                # Apply circular mutation to stay within bounds
-                new_idx = (current_idx + step) % range_size
-                mutated[key] = list(self.parameter_ranges[key])[new_idx]
-                
-        return mutated
+        return self.decode(self.mutate_indices(self.encode([individual]), diversity))[0]
     
     def crossover(self, parent1: Dict, parent2: Dict) -> Dict:
-        child = {}
-        for key in parent1.keys():
-            # Implement arithmetic crossover
-            if isinstance(parent1[key], (int, float)):
-                weight = random.random()
-                value = int(parent1[key] * weight + parent2[key] * (1 - weight))
-                # Ensure value is in range
-                valid_values = list(self.parameter_ranges[key])
-                closest_idx = min(range(len(valid_values)), 
-                                key=lambda i: abs(valid_values[i] - value))
-                child[key] = valid_values[closest_idx]
-            else:
-                child[key] = random.choice([parent1[key], parent2[key]])
-        return child
+        return self.decode(self.crossover_indices(self.encode([parent1]), self.encode([parent2])))[0]
     
-    def optimize(self, fitness_function, n_generations: int, min_diversity: float = 0.3):
-        population = self.generate_population()
+    def start_pool(self, workers: int, initargs: tuple):
+        self._pool_args = (workers, initargs)
+        self._pool_size = workers or os.cpu_count()
+        self._pool = multiprocessing.Pool(processes=self._pool_size, initializer=_init_worker, initargs=initargs)
+
+    def stop_pool(self):
+        # terminate also kills calls still running, close/join would wait for them
+        pool, self._pool = self._pool, None
+        pool.terminate()
+        pool.join()
+
+    def evaluate_in_pool(self, population: List[Dict], timeout: float = None) -> List[float]:
+        """
+        Evaluates the individuals on the worker pool. At most one evaluation per worker is in
+        flight, so each timeout runs from the moment its evaluation starts. Individuals not scored
+        in time get None (see evaluate_population); running calls cannot be cancelled, so the pool
+        is then replaced and the evaluations it interrupted are submitted again.
+        """
+        results = [None] * len(population)
+        pending = list(range(len(population)))[::-1]
+        running = {}
+        done = queue.Queue()
+
+        while pending or running:
+            while pending and len(running) < self._pool_size:
+                i = pending.pop()
+                # The token tells apart results of evaluations resubmitted after a pool restart
+                token = object()
+                running[i] = (token, time.monotonic() + timeout if timeout else None)
+                self._pool.apply_async(_evaluate_params, (population[i],),
+                                       callback=lambda value, i=i, token=token: done.put((i, token, True, value)),
+                                       error_callback=lambda error, i=i, token=token: done.put((i, token, False, error)))
+
+            deadline = min(deadline for _, deadline in running.values()) if timeout else None
+            try:
+                i, token, success, value = done.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                now = time.monotonic()
+                expired = [i for i, (_, deadline) in running.items() if deadline <= now]
+                print(f"\nEvaluation timed out for {len(expired)} individuals")
+                for i in expired:
+                    del running[i]
+                pending.extend(running)
+                running.clear()
+                self.stop_pool()
+                self.start_pool(*self._pool_args)
+                continue
+
+            if i not in running or running[i][0] is not token:
+                continue
+            del running[i]
+            if not success:
+                raise value
+            results[i] = value
+        return results
+
+    def optimize(
+        self,
+        fitness_function,
+        n_generations: int,
+        min_diversity: float = 0.3,
+        executor: str = None,
+        workers: int = None,
+        data=None,
+        strategy=None,
+        timeout: float = None,
+        batch: bool = False
+    ):
+        """
+        Runs the genetic search.
+
+        By default fitness_function receives the list of individuals of each generation. With
+        executor='process' it is evaluated per individual as fitness_function(data, strategy, **params)
+        on a pool of `workers` processes that lives for the whole optimize call; data, strategy
+        and fitness_function are sent to each worker once at startup, so they must be picklable.
+
+        With batch=True, fitness_function is a batch fitness such as batch_backtest, called once
+        per generation as fitness_function(data, strategy, population, indicators=...). The
+        indicators of the whole parameter ranges are computed once by precompute_indicators,
+        so each generation is indexing into the tensor plus the simulation.
+        """
+        # Scores cached by a previous run may come from other data or another fitness function
+        self.fitness_cache = {}
+        self.cache_history = []
+        if batch:
+            if executor is not None:
+                raise ValueError("batch=True evaluates whole generations in this process, it cannot be combined with an executor")
+            indicators = self.precompute_indicators(data, strategy)
+            return self._evolve(lambda population: self._evaluate_batch(fitness_function, data, strategy, population, indicators),
+                                n_generations, min_diversity)
+        if executor is None:
+            return self._evolve(fitness_function, n_generations, min_diversity)
+        if executor != 'process':
+            raise ValueError(f"Unknown executor: {executor}. Available executors: ('process',)")
+
+        self.start_pool(workers, (data, strategy, fitness_function))
+        try:
+            return self._evolve(lambda population: self.evaluate_in_pool(population, timeout),
+                                n_generations, min_diversity)
+        finally:
+            self.stop_pool()
+
+    def _evaluate_batch(self, fitness_function, data, strategy, population: List[Dict], indicators) -> List[float]:
+        results = np.asarray(fitness_function(data, strategy, population, indicators=indicators), dtype=np.float64)
+        return np.where(np.isnan(results), -np.inf, results).tolist()
+
+    def _evolve(self, fitness_function, n_generations: int, min_diversity: float):
+        indices = self.random_indices(self.population_size)
         best_solution = None
         best_fitness = float('-inf')
         generations_without_improvement = 0
         
         for generation in range(n_generations):
             # Evaluate fitness
-            fitness_values = fitness_function(population)
+            population = self.decode(indices)
+            fitness_values = np.asarray(self.evaluate_population(fitness_function, population), dtype=np.float64)
             
             # Track best solution
             current_best_idx = np.argmax(fitness_values)
@@ -103,38 +307,31 @@ class GeneticOptimizer:
                 generations_without_improvement += 1
             
             # Calculate diversity
-            diversity = self.calculate_population_diversity(population)
+            diversity = self.population_diversity(indices)
             self.diversity_history.append(diversity)
             self.best_fitness_history.append(best_fitness)
             
             # Store elite individuals
-            elite = sorted(zip(population, fitness_values), 
-                         key=lambda x: x[1], 
-                         reverse=True)[:self.elite_size]
-            elite_population = [e[0] for e in elite]
-            
-            # Create new population
-            new_population = elite_population.copy()
+            elite = indices[np.argsort(-fitness_values, kind='stable')[:self.elite_size]]
+            n_children = self.population_size - len(elite)
             
             # Restart population if diversity is too low or no improvement
             if diversity < min_diversity or generations_without_improvement > 10:
                 print(f"Restarting population at generation {generation}")
-                new_population.extend(self.generate_population()[:self.population_size - self.elite_size])
+                children = self.random_indices(n_children)
                 generations_without_improvement = 0
             else:
-                # Regular evolution
-                while len(new_population) < self.population_size:
-                    parent1 = self.tournament_selection(population, fitness_values)
-                    parent2 = self.tournament_selection(population, fitness_values)
-                    child = self.crossover(parent1, parent2)
-                    child = self.adaptive_mutation(child, diversity)
-                    new_population.append(child)
+                # Regular evolution, the whole generation at once
+                parents1 = indices[self.select_indices(fitness_values, n_children)]
+                parents2 = indices[self.select_indices(fitness_values, n_children)]
+                children = self.mutate_indices(self.crossover_indices(parents1, parents2), diversity)
             
-            population = new_population
+            indices = np.vstack([elite, children])
             
+            cache_info = f" - Cache hits: {self.cache_history[-1]['hits']}" if self.cache_fitness else ''
             print(f'Generation {generation}/{n_generations} - '
                   f'Best Fitness: {best_fitness:.2f} - '
-                  f'Diversity: {diversity:.2f}', end='\r')
+                  f'Diversity: {diversity:.2f}{cache_info}', end='\r')
             
         return best_solution, best_fitness, self.best_fitness_history, self.diversity_history
     
@@ -148,35 +345,116 @@ class GridSearchOptimizer:
         self.best_params = {}
         self.best_result = -np.inf
     
+    def precompute_indicators(self):
+        """Indicator tensor of the strategy for the whole grid, used by optimize(..., batch_size=...)"""
+        precompute = getattr(self.strategy, 'precompute', None)
+        return precompute(self.data, self.param_ranges) if precompute else None
+
     def _calculate_total_iterations(self) -> int:
         return np.prod([len(range_) for range_ in self.param_ranges.values()])
     
-    def optimize(self,fitness_function):
+    def _update_best(self, params: Dict, result, index: int):
+        # Ties keep the earliest combination so serial and parallel runs agree
+        if result > self.best_result or (result == self.best_result and index < self._best_index):
+            self.best_result = result
+            self.best_params = params.copy()
+            self._best_index = index
+
+    def _print_progress(self, done: int, total_iters: int):
+        print(
+            f'Iteration: {done} / {total_iters} - '
+            f'Best Params {self.best_params} - '
+            f'Best Result: {self.best_result:.2f} - ', end='\r')
+
+    def optimize(self, fitness_function, n_jobs: int = 1, chunk_size: int = None, batch_size: int = None):
+        """
+        Evaluates every parameter combination and keeps the best one.
+
+        With n_jobs > 1 (or -1 for all cores) the parameter product is split in chunks of
+        chunk_size combinations and evaluated on a process pool. The data, strategy and
+        fitness_function are sent to each worker once, when the pool starts, so they must be
+        picklable (module level functions, not lambdas).
+
+        With batch_size, fitness_function is a batch fitness such as batch_backtest, called as
+        fitness_function(data, strategy, param_list, indicators=...) on batch_size combinations
+        at a time. The indicators of the whole grid are computed once by precompute_indicators,
+        so each batch is indexing into the tensor plus the simulation. Batches run in this
+        process, so batch_size cannot be combined with n_jobs > 1.
+        """
         param_names = list(self.param_ranges.keys())
         param_values = list(self.param_ranges.values())
         total_iters = self._calculate_total_iterations()
+        self._best_index = np.inf
         
         param_combinations = itertools.product(*param_values)
 
-        for i,values in enumerate(param_combinations):
-            # Crear diccionario de parámetros
-            params = dict(zip(param_names, values))
+        n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        if batch_size and n_jobs > 1:
+            raise ValueError("batch_size evaluates the grid in this process, it cannot be combined with n_jobs > 1")
+        if batch_size:
+            self._optimize_batch(fitness_function, param_names, param_combinations, total_iters, batch_size)
+        elif n_jobs > 1:
+            self._optimize_parallel(fitness_function, param_names, param_combinations, total_iters, n_jobs, chunk_size)
+        else:
+            for i,values in enumerate(param_combinations):
+                # Crear diccionario de parámetros
+                params = dict(zip(param_names, values))
+                    
+                # Ejecutar estrategia y obtener resultado
+                result = fitness_function(self.data, self.strategy, **params)
                 
-            # Ejecutar estrategia y obtener resultado
-            result = fitness_function(self.data, self.strategy, **params)
-            
-            # Actualizar mejores parámetros si el resultado es mejor
-            if result > self.best_result:
-                self.best_result = result
-                self.best_params = params.copy()
-                
-        
-            print(
-                f'Iteration: {i+1} / {total_iters} - '
-                f'Best Params {self.best_params} - '
-                f'Best Result: {self.best_result:.2f} - ', end='\r')
+                # Actualizar mejores parámetros si el resultado es mejor
+                self._update_best(params, result, i)
+                self._print_progress(i+1, total_iters)
             
         return {
             'best_params': self.best_params,
             'best_result': self.best_result,
-        }
\ No newline at end of file
+        }
+
+    def _optimize_batch(self, fitness_function, param_names, param_combinations, total_iters, batch_size):
+        indicators = self.precompute_indicators()
+        done = 0
+        while True:
+            batch = [dict(zip(param_names, values)) for values in itertools.islice(param_combinations, batch_size)]
+            if not batch:
+                break
+            results = np.asarray(fitness_function(self.data, self.strategy, batch, indicators=indicators), dtype=np.float64)
+            results = np.where(np.isnan(results), -np.inf, results)
+            # First maximum of the batch, so ties keep the earliest combination as in the other modes
+            best = int(np.argmax(results))
+            self._update_best(batch[best], results[best], done + best)
+            done += len(batch)
+            self._print_progress(done, total_iters)
+
+    def _optimize_parallel(self, fitness_function, param_names, param_combinations, total_iters, n_jobs, chunk_size):
+        chunk_size = chunk_size or max(1, min(1000, int(total_iters // (n_jobs * 4))))
+        max_pending = n_jobs * 2
+        done = 0
+        start = 0
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(self.data, self.strategy, fitness_function)) as executor:
+            pending = set()
+            exhausted = False
+
+            while pending or not exhausted:
+                # Keep a bounded number of chunks in flight instead of materializing the whole grid
+                while not exhausted and len(pending) < max_pending:
+                    chunk = list(itertools.islice(param_combinations, chunk_size))
+                    if not chunk:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(_evaluate_grid_chunk, param_names, start, chunk))
+                    start += len(chunk)
+
+                if not pending:
+                    break
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk_start, results = future.result()
+                    for offset, (values, result) in enumerate(results):
+                        self._update_best(dict(zip(param_names, values)), result, chunk_start + offset)
+                    done += len(results)
+                    self._print_progress(done, total_iters)
@@ -1,9 +1,16 @@
 import psycopg2
+import psycopg2.pool
+from psycopg2 import extras
+import io
+import uuid
+import threading
+import time
+from contextlib import contextmanager
 import os
 import json
 import binance.client as bclient
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
     ###########################################
     ########### CREDENTIALS ###################
@@ -85,46 +92,163 @@ class PgCredentialsManager(CredentialsManagerBase):
 
 
 class PgConnecionManager:
-    def __init__(self,credentials: PgCredentialsManager):
+    def __init__(self,credentials: PgCredentialsManager, minconn=1, maxconn=5, max_idle=300):
+        """
+        Pool of connections shared by the query managers, which borrow one per operation.
+
+        :param minconn: Connections opened by connect() and kept open while idle. Connections are
+            otherwise opened on demand.
+        :param maxconn: Maximum open connections, borrowers wait while all of them are in use.
+        :param max_idle: Seconds after which an idle connection above minconn is closed.
+        """
         self._credentials = credentials
-        self.connection = None
-        self.connect() 
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_idle = max_idle
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
     
     @property
     def is_connected(self):
-        return (
-            self.connection is not None 
-            and not self.connection.closed 
+        with self._condition:
+            return self._size > 0
+
+    def _new_connection(self):
+        return psycopg2.connect(
+            host=self._credentials.hostname,
+            database=self._credentials.database,
+            port=self._credentials.port,
+            user=self._credentials.username,
+            password=self._credentials.password
         )
 
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as e:
+            print(f"Error closing connection: {e}")
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _is_alive(self, connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap(self):
+        """Closes the connections idle for longer than max_idle, keeping minconn open"""
+        now = time.monotonic()
+        with self._condition:
+            expired = [item for item in self._idle if now - item[1] > self.max_idle]
+            expired = expired[:max(0, self._size - self.minconn)]
+            for item in expired:
+                self._idle.remove(item)
+        for connection, _ in expired:
+            self._close(connection)
+
     def disconnect(self):
-            
-        if self.connection:
-            try:
-                self.connection.close()
-            except Exception as e:
-                print(f"Error closing connection: {e}")
-            self.connection = None
+        """Closes the idle connections, borrowed ones are closed when given back"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
 
         if not self.is_connected:
             print("Disconnection successful")
 
-
     def connect(self):
-        if self.connection: self.disconnect()
-        
-        try:
-            self.connection = psycopg2.connect(
-                host=self._credentials.hostname,
-                database=self._credentials.database,
-                port=self._credentials.port,
-                user=self._credentials.username,
-                password=self._credentials.password
-            )
+        """Opens connections up to minconn"""
+        with self._condition:
+            missing = max(0, self.minconn - self._size)
+            self._size += missing
+
+        for _ in range(missing):
+            try:
+                connection = self._new_connection()
+            except psycopg2.Error as e:
+                print(f"Connection : {e}")
+                with self._condition:
+                    self._size -= 1
+                continue
+            self.putconn(connection)
+        if missing and self.is_connected:
             print("Connection sucessful")
-        except psycopg2.Error as e:
-            print(f"Connection : {e}")
-            self.connection = None
+
+    def getconn(self, timeout=None):
+        """Borrows a live connection, waiting up to timeout seconds while maxconn are in use"""
+        self._reap()
+        while True:
+            with self._condition:
+                if not self._idle and self._size >= self.maxconn:
+                    if not self._condition.wait_for(lambda: self._idle or self._size < self.maxconn, timeout):
+                        raise psycopg2.pool.PoolError("Connection pool exhausted")
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                else:
+                    connection = None
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    return self._new_connection()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+
+            # Connections dropped while idle (e.g. database restart) are replaced
+            if self._is_alive(connection):
+                return connection
+            self._close(connection)
+
+    def putconn(self, connection, close=False):
+        """Gives a borrowed connection back to the pool, discarding any uncommitted work"""
+        if close or connection.closed:
+            self._close(connection)
+            return
+        try:
+            if connection.status != psycopg2.extensions.STATUS_READY:
+                connection.rollback()
+        except psycopg2.Error:
+            self._close(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def borrow(self):
+        """Borrows a connection for the duration of the with block"""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def execute(self, func, retries=1):
+        """
+        Runs func(connection) on a borrowed connection. When the connection is lost
+        (e.g. a database restart) it is replaced by a new one and func is retried.
+        """
+        for attempt in range(retries + 1):
+            connection = self.getconn()
+            try:
+                return func(connection)
+            except psycopg2.OperationalError as e:
+                if not connection.closed or attempt == retries:
+                    raise
+                print(f"Connection lost, reconnecting: {e}")
+            finally:
+                self.putconn(connection)
 
     def __enter__(self):
         return self
@@ -151,28 +275,24 @@ class TruncateQueriesManager:
         self._connection = connection
         self._prefact = prefact_table
         self.query = None
-        self.conn = connection.connection
         self.generate_query()
 
     def generate_query(self):
         self.query = f"TRUNCATE TABLE public.{self._prefact};"
 
+    def _truncate_table(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(self.query)
+        conn.commit()
+
     def truncate_table(self):
-        
+        # Uncommitted work of a failed operation is rolled back when the connection returns to the pool
         try:
-            conn = self.conn
-            cursor = conn.cursor()
-            cursor.execute(self.query)
-            conn.commit()
+            self._connection.execute(self._truncate_table)
 
         except Exception as e:
-            conn.rollback()
             print(f"An error occurred during data truncation: {e}")
 
-        finally:
-            if cursor:
-                cursor.close()
-
 
 class InsertQueriesManager:
     def __init__(self,df: pd.DataFrame, connection: PgConnecionManager, prefact_table: str):
@@ -180,7 +300,7 @@ class InsertQueriesManager:
         self._connection = connection
         self._prefact = prefact_table
         self.query = None
-        self.conn = connection.connection
+        self.copy_query = None
         self.generate_query()
 
     def generate_query(self):
@@ -189,33 +309,41 @@ class InsertQueriesManager:
         columns_string = ', '.join(format_columns)
         primary_key = format_columns[0]
 
+        # Fallback for tables that already hold some of the rows: COPY cannot skip conflicts
         self.query = f"""
         INSERT INTO public.{self._prefact}(
         {columns_string})
-        VALUES ({('%s,'*len(columns))[:-1]})
+        VALUES %s
         ON CONFLICT ({primary_key}) DO NOTHING;
         """
 
+        self.copy_query = f"COPY public.{self._prefact} ({columns_string}) FROM STDIN WITH (FORMAT csv)"
+
+    def csv_buffer(self, df: pd.DataFrame) -> io.StringIO:
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        return buffer
+
+    def _insert_data(self, conn, df: pd.DataFrame):
+        with conn.cursor() as cursor:
+            try:
+                cursor.copy_expert(self.copy_query, self.csv_buffer(df))
+            except psycopg2.errors.UniqueViolation:
+                conn.rollback()
+                extras.execute_values(cursor, self.query, df.itertuples(index=False, name=None), page_size=1000)
+        conn.commit()
 
     def insert_data(self):
+        # Keep the first row of each key, as ON CONFLICT DO NOTHING would
+        df = self._df.drop_duplicates(subset=self._df.columns[0])
         try:
-            conn = self.conn
-            cursor = conn.cursor()
-
-            for index, row in self._df.iterrows():
-                data =[row[col] for col in self._df.columns]
-                cursor.execute(self.query, data)
-            conn.commit()
-            print(f'\n\t{index+1} rows inserted')
+            self._connection.execute(lambda conn: self._insert_data(conn, df))
+            print(f'\n\t{len(df)} rows inserted')
 
         except Exception as e:
-            conn.rollback()
             print(f"An error occurred during data insertion: {e}")
 
-        finally:
-            if cursor:
-                cursor.close()
-
 class MergeQueriesManager:
     def __init__(self,df: pd.DataFrame, connection: PgConnecionManager, prefact_table: str ,fact_table: str):
         self._df = df
@@ -223,7 +351,8 @@ class MergeQueriesManager:
         self._fact = fact_table
         self._prefact = prefact_table
         self.query = None
-        self.conn = connection.connection
+        self.bounds_query = None
+        self.matched_query = None
         self.generate_query()
 
     def generate_query(self):
@@ -231,18 +360,34 @@ class MergeQueriesManager:
         columns = list(self._df.columns)
         format_columns = [item.lower().replace(' ', '_') for item in columns]
         primary_key = format_columns[0]
+        value_columns = format_columns[1:]
 
-        update_set = ", ".join([f"{col}=src.{col}" for col in format_columns])
+        update_set = ", ".join([f"{col}=src.{col}" for col in value_columns])
+        changed = f"({', '.join([f'lve.{col}' for col in value_columns])}) IS DISTINCT FROM ({', '.join([f'src.{col}' for col in value_columns])})"
 
         insert_columns = ", ".join(format_columns)
         insert_values = ", ".join([f"src.{col}" for col in format_columns])
 
+        # Time window of the batch, passed to the merge as constants so only the fact rows
+        # (and partitions) inside it are scanned
+        self.bounds_query = f"SELECT MIN({primary_key}), MAX({primary_key}), COUNT(*) FROM {self._prefact};"
+
+        self.matched_query = f"""
+        SELECT COUNT(*)
+        FROM {self._prefact} AS src
+        JOIN {self._fact} AS lve
+        ON lve.{primary_key} = src.{primary_key}
+        AND lve.{primary_key} BETWEEN %(start)s AND %(end)s;
+        """
+
+        # Rows already stored with the same values are left untouched, so re-sent candles cost no writes
         self.query = f"""
         MERGE INTO {self._fact} AS lve
         USING {self._prefact} AS src
         ON lve.{primary_key} = src.{primary_key}
+        AND lve.{primary_key} BETWEEN %(start)s AND %(end)s
 
-        WHEN MATCHED THEN
+        WHEN MATCHED AND {changed} THEN
             UPDATE SET 
             {update_set}
 
@@ -251,25 +396,177 @@ class MergeQueriesManager:
             VALUES ({insert_values});
         """
 
+    def _merge_data(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(self.bounds_query)
+            start, end, total = cursor.fetchone()
+            if not total:
+                return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+            params = {'start': start, 'end': end}
+            cursor.execute(self.matched_query, params)
+            matched = cursor.fetchone()[0]
+            cursor.execute(self.query, params)
+            # MERGE only reports the rows it wrote: every unmatched row is inserted, the rest of them are updates
+            written = cursor.rowcount
+        conn.commit()
+
+        inserted = total - matched
+        updated = written - inserted
+        return {'inserted': inserted, 'updated': updated, 'unchanged': matched - updated}
+
     def merge_data(self):
-    
+        """Merges the prefact table into the fact table, returns the inserted/updated/unchanged row counts"""
         try:
-            conn = self.conn
-            cursor = conn.cursor()
-            cursor.execute(self.query)
-            conn.commit()
+            counts = self._connection.execute(self._merge_data)
+            print(f"\n\t{counts['inserted']} rows inserted, {counts['updated']} updated, {counts['unchanged']} unchanged")
+            return counts
 
         except Exception as e:
-            conn.rollback()
             print(f"An error occurred during data merge: {e}")
 
-        finally:
-            if cursor:
-                cursor.close()
+# Staging tables older than this are leftovers of loads that were killed before dropping them
+STALE_STAGING_SECONDS = 24 * 3600
+
+class StagingQueriesManager:
+    def __init__(self, connection: PgConnecionManager, fact_table: str, max_age: float = STALE_STAGING_SECONDS):
+        self._connection = connection
+        self._fact = fact_table
+        self.prefix = f"{fact_table}_stage_"
+        # Unique per load, so several loaders can stage data for the same fact table at once.
+        # The creation time tells the tables of running loads apart from leftovers
+        self.table = f"{self.prefix}{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        self.max_age = max_age
+        self.create_query = None
+        self.drop_query = None
+        self.stale_query = None
+        self.generate_query()
+
+    def generate_query(self):
+        # UNLOGGED: staging rows are disposable, so they are not written to the WAL.
+        # Unlike a TEMP table it is visible from every pooled connection the load borrows
+        self.create_query = f"CREATE UNLOGGED TABLE public.{self.table} (LIKE public.{self._fact} INCLUDING DEFAULTS);"
+        self.drop_query = f"DROP TABLE IF EXISTS public.{self.table};"
+        # '_' is a LIKE wildcard
+        self.stale_query = "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename LIKE %(pattern)s;"
+
+    def _run(self, conn, query):
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+        conn.commit()
+
+    def stale_tables(self, tables, now: float = None) -> list:
+        """
+        Staging tables of the fact table created more than max_age seconds ago. Tables named
+        without their creation time come from older versions and are always stale
+        """
+        now = time.time() if now is None else now
+        stale = []
+        for table in tables:
+            if not table.startswith(self.prefix) or table == self.table:
+                continue
+            parts = table[len(self.prefix):].split('_')
+            if len(parts) != 2 or not parts[0].isdigit() or now - int(parts[0]) > self.max_age:
+                stale.append(table)
+        return stale
+
+    def _drop_stale_tables(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(self.stale_query, {'pattern': self.prefix.replace('_', '\\_') + '%'})
+            tables = self.stale_tables([row[0] for row in cursor.fetchall()])
+            for table in tables:
+                cursor.execute(f"DROP TABLE IF EXISTS public.{table};")
+        conn.commit()
+        return tables
+
+    def create_table(self):
+        try:
+            self._connection.execute(lambda conn: self._run(conn, self.create_query))
+
+        except Exception as e:
+            print(f"An error occurred during staging table creation: {e}")
+
+    def drop_table(self):
+        try:
+            self._connection.execute(lambda conn: self._run(conn, self.drop_query))
+
+        except Exception as e:
+            print(f"An error occurred during staging table drop: {e}")
+
+    def drop_stale_tables(self):
+        """Drops the staging tables left behind by killed loads (see stale_tables)"""
+        try:
+            tables = self._connection.execute(self._drop_stale_tables)
+            if tables:
+                print(f"Dropped {len(tables)} staging tables left by interrupted loads")
+
+        except Exception as e:
+            print(f"An error occurred dropping stale staging tables: {e}")
+
+class CoverageQueriesManager:
+    def __init__(self, connection: PgConnecionManager, fact_table: str, interval: timedelta):
+        self._connection = connection
+        self._fact = fact_table
+        self._interval = interval
+        self.query = None
+        self.bounds_query = None
+        self.generate_query()
+
+    def generate_query(self):
+        # Both queries only read open_time within the range, so they are served by the primary key index
+        self.bounds_query = f"""
+        SELECT MIN(open_time), MAX(open_time)
+        FROM public.{self._fact}
+        WHERE open_time >= %(start)s AND open_time < %(end)s;
+        """
+
+        self.query = f"""
+        SELECT open_time + %(step)s AS gap_start, next_open_time AS gap_end
+        FROM (
+            SELECT open_time, LEAD(open_time) OVER (ORDER BY open_time) AS next_open_time
+            FROM public.{self._fact}
+            WHERE open_time >= %(start)s AND open_time < %(end)s
+        ) AS coverage
+        WHERE next_open_time > open_time + %(step)s
+        ORDER BY gap_start;
+        """
+
+    def _get_gaps(self, conn, start: datetime, end: datetime):
+        params = {'start': start, 'end': end, 'step': self._interval}
+        with conn.cursor() as cursor:
+            cursor.execute(self.bounds_query, params)
+            first, last = cursor.fetchone()
+            if first is None:
+                return [(start, end)]
+
+            gaps = [(start, first)] if first > start else []
+            cursor.execute(self.query, params)
+            gaps.extend(cursor.fetchall())
+            if last + self._interval < end:
+                gaps.append((last + self._interval, end))
+            return gaps
+
+    def get_gaps(self, start: datetime, end: datetime):
+        """Missing [start, end) ranges of candles in the fact table"""
+        try:
+            return self._connection.execute(lambda conn: self._get_gaps(conn, start, end))
+
+        except Exception as e:
+            print(f"An error occurred reading the table coverage: {e}")
+            return [(start, end)]
 
 class QueriesManager:
-    def __init__(self, df:pd.DataFrame, connection:PgConnecionManager, prefact_table:str, fact_table:str):
-        self._truncateManager = TruncateQueriesManager(connection, prefact_table)
+    def __init__(self, df:pd.DataFrame, connection:PgConnecionManager, prefact_table:str, fact_table:str, staging:bool=False):
+        """
+        :param staging: Load through a staging table created for this load instead of truncating
+            the shared prefact table (prefact_table is then ignored), so loaders can run concurrently.
+        """
+        self._stagingManager = None
+        if staging:
+            self._stagingManager = StagingQueriesManager(connection, fact_table)
+            prefact_table = self._stagingManager.table
+        else:
+            self._truncateManager = TruncateQueriesManager(connection, prefact_table)
         self._insertManager = InsertQueriesManager(df, connection, prefact_table)
         self._mergeManager = MergeQueriesManager(df, connection, prefact_table,fact_table)
 
@@ -280,12 +577,21 @@ class QueriesManager:
         self._insertManager.insert_data()
 
     def merge_data(self):
-        self._mergeManager.merge_data()
+        return self._mergeManager.merge_data()
 
     def process_data(self):
-        self.truncate_data()
-        self.insert_data()
-        self.merge_data()
+        if self._stagingManager is None:
+            self.truncate_data()
+            self.insert_data()
+            return self.merge_data()
+
+        self._stagingManager.drop_stale_tables()
+        self._stagingManager.create_table()
+        try:
+            self.insert_data()
+            return self.merge_data()
+        finally:
+            self._stagingManager.drop_table()
             
 
     ###########################################
@@ -332,6 +638,32 @@ class ApiExtraction:
         
         return self.format_api(klines)
         
+    def get_futures_range(self, start: datetime, end: datetime, interval):
+        """
+        Closed candles with open time in [start, end), naive UTC datetimes as stored in the fact
+        tables, paging through the 1500 candles limit. The candle in progress is left out, so it
+        is not stored and later counted as covered.
+        """
+        start_ts = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        end_ts = int(end.replace(tzinfo=timezone.utc).timestamp() * 1000) - 1
+        now = time.time() * 1000
+        klines = []
+        while start_ts <= end_ts:
+            page = self._client.futures_klines(
+                    symbol=self._symbol,
+                    interval=interval,
+                    startTime=start_ts,
+                    endTime=end_ts,
+                    limit=1500
+                )
+            page = [kline for kline in page if kline[6] < now]
+            if not page:
+                break
+            klines.extend(page)
+            start_ts = page[-1][0] + 1
+
+        return self.format_api(klines)
+
     def get_spot(self,start_date, end_date, interval):
         start_ts = int(datetime.strptime(start_date, "%Y-%m-%d").timestamp() * 1000)
         end_ts = int(datetime.strptime(end_date, "%Y-%m-%d").timestamp() * 1000)
@@ -344,4 +676,45 @@ class ApiExtraction:
                 limit=1000
             )
         
-        return self.format_api(klines)
\ No newline at end of file
+        return self.format_api(klines)
+
+
+    ###########################################
+    ########### SYNC ##########################
+    ###########################################
+
+# Binance interval units as timedelta arguments
+INTERVAL_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+def interval_to_timedelta(interval: str) -> timedelta:
+    return timedelta(**{INTERVAL_UNITS[interval[-1]]: int(interval[:-1])})
+
+class SyncManager:
+    def __init__(self, connection: PgConnecionManager, extraction: ApiExtraction, fact_table: str, interval: str):
+        """
+        Incremental load of a futures fact table: only the ranges missing in the table are
+        requested to the API and merged, so a refresh costs a few requests instead of the whole range.
+        """
+        self._connection = connection
+        self._extraction = extraction
+        self._fact = fact_table
+        self._interval = interval
+        self._coverageManager = CoverageQueriesManager(connection, fact_table, interval_to_timedelta(interval))
+
+    def sync(self, start: datetime, end: datetime):
+        """Loads the missing candles with open time in [start, end) (naive UTC), returns the rows inserted"""
+        gaps = self._coverageManager.get_gaps(start, end)
+        if not gaps:
+            print(f"Data from {start} to {end} is already up to date")
+            return 0
+
+        print(f"Found {len(gaps)} missing ranges from {start} to {end}")
+        inserted = 0
+        for gap_start, gap_end in gaps:
+            df = self._extraction.get_futures_range(gap_start, gap_end, self._interval)
+            if df.empty:
+                continue
+            print(f"Loading data from {gap_start} to {gap_end}")
+            counts = QueriesManager(df, self._connection, None, self._fact, staging=True).process_data()
+            inserted += counts['inserted'] if counts else 0
+        return inserted
@@ -0,0 +1,27 @@
+from controllers import *
+
+if __name__ == '__main__':
+
+    # Credentials
+    manager = CredentialsManager()
+    pg_credentials = PgCredentialsManager(manager)
+    bn_credentials = BinanceCredentialsManager(manager)
+
+    # Connections
+    pg_connection = PgConnecionManager(pg_credentials)
+    bn_connection = BinanceConnectionManager(bn_credentials, testnet=False)
+
+    # Table and currency params
+    fact_table = 'btcusdtfutures_live'
+    symbol = 'BTCUSDT'
+    interval = '5m'
+    start = datetime(2024, 1, 1)
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    # Only the candles missing in the fact table are downloaded
+    sync = SyncManager(pg_connection, ApiExtraction(bn_connection, symbol), fact_table, interval)
+    try:
+        inserted = sync.sync(start, end)
+        print(f"{inserted} candles loaded")
+    finally:
+        pg_connection.disconnect()
@@ -0,0 +1,106 @@
+import os
+import sys
+from datetime import datetime
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'tools'))
+from candle_reader import COPY_SIGNATURE, PG_EPOCH_US, ReadQueriesManager, parse_binary_copy
+
+COLUMNS = ['open_time', 'close', 'number_of_trades']
+ROWS = [
+    (datetime(2024, 1, 1, 0, 0), 42000.5, 120),
+    (datetime(2024, 1, 1, 0, 1), 42001.0, None),
+    (datetime(2024, 1, 1, 0, 2), 42002.0, 80),
+]
+START = datetime(2024, 1, 1, 0, 0)
+END = datetime(2024, 1, 1, 0, 2)
+
+def binary_copy(rows) -> bytes:
+    """COPY ... WITH (FORMAT binary) output of the rows, NULLs as -1 length fields"""
+    data = COPY_SIGNATURE + b'\x00' * 8
+    for row in rows:
+        data += len(row).to_bytes(2, 'big')
+        for value in row:
+            if value is None:
+                data += (-1).to_bytes(4, 'big', signed=True)
+            elif isinstance(value, datetime):
+                us = int((value - datetime(1970, 1, 1)).total_seconds() * 1_000_000) - PG_EPOCH_US
+                data += (8).to_bytes(4, 'big') + us.to_bytes(8, 'big', signed=True)
+            elif isinstance(value, float):
+                data += (8).to_bytes(4, 'big') + np.array(value, dtype='>f8').tobytes()
+            else:
+                data += (8).to_bytes(4, 'big') + value.to_bytes(8, 'big', signed=True)
+    return data + b'\xff\xff'
+
+
+class FakeCursor:
+    """Serves the rows with open_time in [start, end), as the WHERE clause of the read query"""
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _select(self, params):
+        self._rows = [row for row in self._rows if params['start'] <= row[0] < params['end']]
+
+    def mogrify(self, query, params):
+        self._select(params)
+        return query.encode()
+
+    def copy_expert(self, query, buffer):
+        buffer.write(binary_copy(self._rows))
+
+    def execute(self, query, params):
+        self._select(params)
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """Stands in for both the pool (execute) and a connection (cursor, rollback)"""
+    def execute(self, func):
+        return func(self)
+
+    def cursor(self, name=None):
+        return FakeCursor(ROWS)
+
+    def rollback(self):
+        pass
+
+
+def test_read_falls_back_to_cursor_on_null_integers():
+    arrays = ReadQueriesManager(FakeConnection(), 'btcusdt_1m', chunk_size=1).read(START, END, COLUMNS)
+
+    assert len(arrays['open_time']) == 2
+    assert arrays['number_of_trades'].dtype == np.float64
+    assert arrays['number_of_trades'][0] == 120
+    assert np.isnan(arrays['number_of_trades'][1])
+    assert arrays['open_time'][1] == np.datetime64('2024-01-01T00:01')
+
+
+def test_read_df_returns_nanosecond_timestamps():
+    df = ReadQueriesManager(FakeConnection(), 'btcusdt_1m').read_df(START, END, COLUMNS)
+
+    assert df['open_time'].dtype == np.dtype('datetime64[ns]')
+    assert df['close'].tolist() == [42000.5, 42001.0]
+
+
+def test_parse_binary_copy_fixed_rows():
+    rows = [ROWS[0], ROWS[2]]
+    arrays = parse_binary_copy(binary_copy(rows), COLUMNS)
+
+    assert arrays['open_time'].tolist() == [row[0] for row in rows]
+    assert arrays['close'].tolist() == [42000.5, 42002.0]
+    assert arrays['number_of_trades'].dtype == np.int64
+    assert arrays['number_of_trades'].tolist() == [120, 80]
+
+
+def test_parse_binary_copy_rejects_null_rows():
+    assert parse_binary_copy(binary_copy(ROWS), COLUMNS) is None
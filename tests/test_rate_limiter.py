@@ -0,0 +1,106 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+from extractor.rate_limiter import RETRY_AFTER_HEADER, USED_WEIGHT_HEADER, TokenBucketRateLimiter
+
+
+class FakeClock:
+    """Wall clock advanced only by the limiter sleeps"""
+    def __init__(self, now: float = 0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(clock, capacity=100, period=60):
+    return TokenBucketRateLimiter(capacity=capacity, period=period, clock=clock, sleep=clock.sleep)
+
+
+def test_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+
+    limiter.acquire(40)
+    assert limiter.tokens == pytest.approx(60)
+    clock.now = 12
+    assert limiter.tokens == pytest.approx(80)
+    clock.now = 59
+    # Never above capacity
+    assert limiter.tokens == pytest.approx(100)
+
+
+def test_acquire_waits_for_bucket_refill():
+    clock = FakeClock(now=59)
+    limiter = make_limiter(clock)
+
+    limiter.acquire(100)
+    # New window at 60 but the bucket only holds the tokens refilled in one second
+    clock.now = 60
+    limiter.acquire(30)
+
+    assert clock.slept
+    assert clock.now == pytest.approx(59 + 30 * 60 / 100)
+
+
+def test_used_weight_header_fills_the_window():
+    clock = FakeClock(now=10)
+    limiter = make_limiter(clock)
+
+    # Weight used by other processes sharing the IP
+    limiter.update({USED_WEIGHT_HEADER: '95'})
+    assert limiter.window_used == 95
+
+    limiter.acquire(10)
+    # Waited for the next clock-aligned window
+    assert clock.now >= 60
+    assert limiter.window_used == 10
+
+
+def test_retry_after_header_blocks_every_request():
+    clock = FakeClock(now=10)
+    limiter = make_limiter(clock)
+
+    limiter.update({RETRY_AFTER_HEADER: '5'})
+    limiter.acquire(1)
+
+    assert clock.now >= 15
+
+
+def test_client_never_exceeds_server_weight():
+    pytest.importorskip('binance')
+    from extractor.api_clients import BinanceFuturesClient
+    from extractor.rate_limiter import futures_klines_weight
+
+    clock = FakeClock(now=0)
+
+    class FakeResponse:
+        def __init__(self, headers):
+            self.headers = headers
+
+    class FakeBinance:
+        """Counts the weight per clock-aligned minute like the server, starting with weight used elsewhere"""
+        def __init__(self, used: int):
+            self.used = {0: used}
+            self.response = None
+
+        def futures_klines(self, **kwargs):
+            window = int(clock() // 60)
+            self.used[window] = self.used.get(window, 0) + futures_klines_weight(kwargs['limit'])
+            assert self.used[window] <= 2400, "Weight limit exceeded"
+            self.response = FakeResponse({USED_WEIGHT_HEADER: str(self.used[window])})
+            return []
+
+    server = FakeBinance(used=2000)
+    client = BinanceFuturesClient(server, make_limiter(clock, capacity=2400))
+    for _ in range(600):
+        client.get_klines('BTCUSDT', '1m', 0, 1)
+
+    assert sum(server.used.values()) == 2000 + 600 * futures_klines_weight(BinanceFuturesClient.LIMIT)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import sys
+import pytest
+
+websockets = pytest.importorskip('websockets')
+pytest.importorskip('websocket')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+from stream.stream_multiplexer import BinanceFuturesStreamMultiplexer
+
+STEP = 60_000
+STREAM_A = 'btcusdt@kline_1m'
+STREAM_B = 'ethusdt@kline_1m'
+
+
+def kline_message(stream: str, open_time: int) -> str:
+    kline = {'t': open_time, 'T': open_time + STEP - 1, 'x': True, 'o': '1', 'h': '2', 'l': '0.5', 'c': '1.5',
+             'v': '10', 'q': '15', 'n': 3, 'V': '4', 'Q': '6'}
+    return json.dumps({'stream': stream, 'data': {'e': 'kline', 'k': kline}})
+
+
+class ReplayServer:
+    """Local combined stream server: replays scripted messages per connection and records client requests"""
+    def __init__(self, on_connect=(), on_request=None):
+        self.on_connect = list(on_connect)
+        self.on_request = on_request or {}
+        self.requests = []
+        self.connections = 0
+
+    async def handler(self, ws):
+        script = self.on_connect[self.connections] if self.connections < len(self.on_connect) else []
+        self.connections += 1
+        for message in script:
+            if message is None:
+                # Drop the connection
+                return
+            await ws.send(message)
+        async for message in ws:
+            request = json.loads(message)
+            self.requests.append((request['method'], request['params']))
+            for reply in self.on_request.get(request['method'], []):
+                await ws.send(reply)
+
+    async def __aenter__(self):
+        self._server = await websockets.serve(self.handler, 'localhost', 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://localhost:{port}/stream"
+        return self
+
+    async def __aexit__(self, *args):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+async def wait_until(condition, timeout: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_subscribe_and_unsubscribe_dispatch():
+    async def run():
+        received = {STREAM_A: [], STREAM_B: []}
+
+        def handler(stream):
+            async def handle(is_closed, open_time, *args):
+                received[stream].append(open_time)
+            return handle
+
+        server = ReplayServer(
+            on_connect=[[kline_message(STREAM_A, 0), kline_message(STREAM_B, 0)]],
+            on_request={
+                'SUBSCRIBE': [kline_message(STREAM_B, STEP), kline_message(STREAM_A, STEP)],
+                'UNSUBSCRIBE': [kline_message(STREAM_A, 2 * STEP), kline_message(STREAM_B, 2 * STEP)],
+            }
+        )
+        async with server:
+            multiplexer = BinanceFuturesStreamMultiplexer(base_url=server.url)
+            await multiplexer.subscribe([('BTCUSDT', '1m', handler(STREAM_A))])
+            await wait_until(lambda: received[STREAM_A] == [0])
+
+            await multiplexer.subscribe([('ETHUSDT', '1m', handler(STREAM_B))])
+            await wait_until(lambda: received[STREAM_B] == [STEP] and received[STREAM_A] == [0, STEP])
+
+            await multiplexer.unsubscribe([('BTCUSDT', '1m')])
+            await wait_until(lambda: received[STREAM_B] == [STEP, 2 * STEP])
+            await multiplexer.close()
+
+        # Both streams share one connection and the unsubscribed stream is no longer delivered
+        assert server.connections == 1
+        assert server.requests == [('SUBSCRIBE', [STREAM_B]), ('UNSUBSCRIBE', [STREAM_A])]
+        assert received[STREAM_A] == [0, STEP]
+
+    asyncio.run(run())
+
+
+def test_reconnect_backfills_missed_candles():
+    class FakeApiClient:
+        """REST klines up to 3 * STEP, the candles closed while the stream was down"""
+        def __init__(self):
+            self.calls = []
+
+        def get_klines(self, symbol, interval, start_time, end_time):
+            self.calls.append((symbol, interval, start_time))
+            first = -(-start_time // STEP) * STEP
+            return [[t, '1', '2', '0.5', '1.5', '10', t + STEP - 1, '15', 3, '4', '6', '0']
+                    for t in range(first, min(end_time, 3 * STEP) + 1, STEP)]
+
+    async def run():
+        received = []
+
+        async def handle(record):
+            received.append((record.open_time, record.number_of_trades))
+
+        server = ReplayServer(on_connect=[
+            [kline_message(STREAM_A, 0), None],
+            [kline_message(STREAM_A, 4 * STEP)],
+        ])
+        api_client = FakeApiClient()
+        async with server:
+            multiplexer = BinanceFuturesStreamMultiplexer(base_url=server.url, api_client=api_client,
+                                                          max_backoff=0.1, kline_record=True)
+            await multiplexer.subscribe([('BTCUSDT', '1m', handle)])
+            await wait_until(lambda: len(received) == 5)
+            await multiplexer.close()
+
+        assert server.connections == 2
+        assert [open_time for open_time, _ in received] == [0, STEP, 2 * STEP, 3 * STEP, 4 * STEP]
+        assert all(trades == 3 for _, trades in received)
+        assert api_client.calls[0] == ('BTCUSDT', '1m', STEP)
+
+    asyncio.run(run())
+
+
+def test_bad_messages_and_handler_errors_keep_the_connection():
+    async def run():
+        received = []
+
+        async def handle(is_closed, open_time, *args):
+            received.append(open_time)
+            if open_time == STEP:
+                raise ValueError("handler failure")
+
+        server = ReplayServer(on_connect=[[
+            'not json{', json.dumps({'stream': STREAM_A, 'data': {}}),
+            kline_message(STREAM_A, 0), kline_message(STREAM_A, STEP), kline_message(STREAM_A, 2 * STEP),
+        ]])
+        async with server:
+            multiplexer = BinanceFuturesStreamMultiplexer(base_url=server.url)
+            await multiplexer.subscribe([('BTCUSDT', '1m', handle)])
+            await wait_until(lambda: len(received) == 3)
+            await multiplexer.close()
+
+        assert received == [0, STEP, 2 * STEP]
+        assert server.connections == 1
+
+    asyncio.run(run())